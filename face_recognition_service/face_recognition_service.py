@@ -1,7 +1,7 @@
 from deepface import DeepFace
 from pathlib import Path
 from PIL import Image, ImageEnhance
-import json
+import orjson
 import numpy as np
 from typing import Optional, Dict, List, Any, Tuple
 import hashlib
@@ -10,12 +10,81 @@ import requests
 import logging
 import cv2
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from tqdm import tqdm
+
+try:
+    from numba import njit, prange
+except ImportError:  # numba is optional, NumPy/BLAS is used without it
+    njit = None
+
+try:
+    import faiss
+except ImportError:  # faiss is optional, ranking stays exhaustive without it
+    faiss = None
+
+try:
+    import onnxruntime as ort
+except ImportError:  # onnxruntime is only needed for onnx_model_path
+    ort = None
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
 logger = logging.getLogger(__name__)
 
 
+def _l2_normalize(embedding: np.ndarray) -> Optional[np.ndarray]:
+    """Scale an embedding to unit length so cosine distance is 1 - dot."""
+    norm = np.linalg.norm(embedding)
+    if norm == 0:
+        return None
+    return embedding / norm
+
+
+def _rgb_to_bgr(image: np.ndarray) -> np.ndarray:
+    """DeepFace treats in-memory images as BGR (OpenCV order)."""
+    return np.ascontiguousarray(image[:, :, ::-1])
+
+
+if njit is not None:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _cosine_distances(E: np.ndarray, target: np.ndarray) -> np.ndarray:
+        """Cosine distance of every unit-length row of E to a unit target."""
+        out = np.empty(E.shape[0], dtype=np.float32)
+        for i in prange(E.shape[0]):
+            s = 0.0
+            for j in range(E.shape[1]):
+                s += E[i, j] * target[j]
+            out[i] = 1.0 - s
+        return out
+else:
+    def _cosine_distances(E: np.ndarray, target: np.ndarray) -> np.ndarray:
+        """Cosine distance of every unit-length row of E to a unit target."""
+        return 1.0 - E @ target
+
+
+def _quantize_int8(E: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Symmetric per-row int8 quantization. Returns (int8 rows, per-row scale)."""
+    peak = np.max(np.abs(E), axis=-1)
+    scale = 127.0 / np.where(peak > 0, peak, 1.0)
+    quantized = np.round(E * scale[..., None]).astype(np.int8)
+    return quantized, scale.astype(np.float32)
+
+
+if njit is not None:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _int8_cosine_distances(quantized: np.ndarray, scale: np.ndarray, target: np.ndarray) -> np.ndarray:
+        """Approximate cosine distances of int8-quantized unit rows to a float32 unit target."""
+        out = np.empty(quantized.shape[0], dtype=np.float32)
+        for i in prange(quantized.shape[0]):
+            s = np.float32(0.0)
+            for j in range(quantized.shape[1]):
+                s += quantized[i, j] * target[j]
+            out[i] = 1.0 - s / scale[i]
+        return out
+# Without numba there is no int8 kernel: NumPy would upcast the whole int8
+# block to float32 per query, slower than scoring the float32 matrix directly
+
+
 class FaceRecognitionService:
     # Recommended thresholds for different models (cosine distance)
     THRESHOLDS = {
@@ -30,6 +99,24 @@ class FaceRecognitionService:
         'SFace': 0.593
     }
     
+    # Weighted voting based on model reliability
+    MODEL_WEIGHTS = {
+        'Facenet512': 1.5,
+        'ArcFace': 1.5,
+        'VGG-Face': 1.0,
+        'Facenet': 1.0,
+        'OpenFace': 0.8,
+        'DeepFace': 1.0
+    }
+    
+    # Above this many profiles, candidates are shortlisted with a FAISS
+    # HNSW index (when faiss is installed) before exact scoring
+    ANN_MIN_PROFILES = 10000
+    ANN_CANDIDATES = 256
+    
+    # Profile fields included in match results
+    RESULT_FIELDS = ('name', 'profileUrl', 'linkedin_id', 'headline', 'location')
+    
     def __init__(
         self, 
         model_name: str = "VGG-Face",
@@ -45,7 +132,12 @@ class FaceRecognitionService:
         enhance_images: bool = True,  # Image enhancement
         face_quality_threshold: float = 0.0,  # Minimum face quality
         use_parallel: bool = False,  # Parallel processing
-        max_workers: int = 4
+        max_workers: int = 4,
+        download_workers: int = 16,  # Concurrent image downloads
+        embedding_cache_dir: Optional[str] = None,  # Persist profile embeddings across runs
+        quantize_embeddings: bool = False,  # Score with int8 embeddings (needs numba)
+        onnx_model_path: Optional[str] = None,  # ONNX embedder used for model_name
+        onnx_threshold: Optional[float] = None  # Cosine threshold of the ONNX embedder
     ):
         self.model_name = model_name
         self.distance_metric = distance_metric
@@ -60,6 +152,31 @@ class FaceRecognitionService:
         self.face_quality_threshold = face_quality_threshold
         self.use_parallel = use_parallel
         self.max_workers = max_workers
+        self.download_workers = download_workers
+        self.embedding_cache_dir = embedding_cache_dir
+        self.quantize_embeddings = quantize_embeddings and njit is not None
+        if quantize_embeddings and njit is None:
+            logger.warning("quantize_embeddings needs numba for int8 scoring, using float32")
+        
+        # Optional lightweight ONNX embedder, loaded once and used in place
+        # of DeepFace for model_name
+        self.onnx_session = None
+        self.onnx_model_id = None
+        self.onnx_threshold = onnx_threshold
+        if onnx_model_path:
+            if ort is None:
+                raise ImportError("onnxruntime is required for onnx_model_path")
+            if onnx_threshold is None:
+                # The DeepFace threshold of model_name means nothing for another embedder
+                raise ValueError("onnx_threshold is required with onnx_model_path")
+            # Identifies the ONNX embedding space in cache keys and store names
+            self.onnx_model_id = hashlib.sha1(Path(onnx_model_path).read_bytes()).hexdigest()[:16]
+            providers = [
+                p for p in ('CUDAExecutionProvider', 'CPUExecutionProvider')
+                if p in ort.get_available_providers()
+            ]
+            self.onnx_session = ort.InferenceSession(onnx_model_path, providers=providers)
+            logger.info(f"Loaded ONNX embedder {onnx_model_path} ({self.onnx_session.get_providers()[0]})")
         
         # Ensemble setup
         if ensemble_models:
@@ -73,6 +190,7 @@ class FaceRecognitionService:
         self.image_cache = {}
         self.face_cache = {}
         self.embedding_cache = {}  # Cache embeddings for speed
+        self._embedding_stores = {}  # Open on-disk embedding stores per model
     
     def verify_image(self, image_path: str) -> bool:
         """Quick verification that image exists and is valid."""
@@ -83,9 +201,7 @@ class FaceRecognitionService:
             
             try:
                 with Image.open(image_path) as img:
-                    if img.mode != 'RGB':
-                        rgb_path = Path(image_path).with_suffix('.jpg')
-                        img.convert('RGB').save(rgb_path, 'JPEG')
+                    img.verify()
             except Exception as e:
                 logger.debug(f"Failed to open image: {e}")
                 return False
@@ -95,13 +211,33 @@ class FaceRecognitionService:
             logger.debug(f"Image verification failed: {e}")
             return False
     
-    def enhance_image_quality(self, image_path: str) -> str:
+    def load_image(self, image_path: str) -> Optional[np.ndarray]:
+        """
+        Load an image as an RGB uint8 array (H x W x 3).
+        Decodes with OpenCV (libjpeg-turbo), falling back to PIL for
+        formats OpenCV cannot read.
+        """
+        try:
+            img = cv2.imdecode(np.fromfile(image_path, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if img is not None:
+                return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        except Exception as e:
+            logger.debug(f"OpenCV failed to decode {image_path}: {e}")
+        
+        try:
+            with Image.open(image_path) as img:
+                return np.asarray(img.convert('RGB'))
+        except Exception as e:
+            logger.debug(f"Failed to load image {image_path}: {e}")
+            return None
+    
+    def enhance_image_quality(self, image: np.ndarray) -> np.ndarray:
         """
         Enhance image quality for better face recognition.
         Applies brightness, contrast, and sharpness adjustments.
         """
         try:
-            img = Image.open(image_path)
+            img = Image.fromarray(image)
             
             # Enhance contrast
             enhancer = ImageEnhance.Contrast(img)
@@ -115,17 +251,12 @@ class FaceRecognitionService:
             enhancer = ImageEnhance.Brightness(img)
             img = enhancer.enhance(1.1)
             
-            # Save enhanced image
-            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.jpg')
-            img.save(temp_file.name, 'JPEG', quality=95)
-            temp_file.close()
-            
             logger.debug("Image enhanced")
-            return temp_file.name
+            return np.asarray(img)
             
         except Exception as e:
             logger.debug(f"Image enhancement failed: {e}")
-            return image_path
+            return image
     
     def assess_face_quality(self, face_obj: Dict) -> float:
         """
@@ -207,29 +338,19 @@ class FaceRecognitionService:
     
     def extract_best_face(
         self, 
-        image_path: str,
-        target_size: tuple = (224, 224)
-    ) -> Optional[Tuple[str, float]]:
+        image: np.ndarray
+    ) -> Optional[Tuple[np.ndarray, float]]:
         """
-        Extract the best quality face from image.
-        Returns (path, quality_score) or None.
+        Extract the best quality face from an RGB image.
+        Returns (face_array, quality_score) or None.
         """
-        cache_key = hashlib.md5(f"{image_path}_extracted".encode()).hexdigest()
-        
-        if self.cache_images and cache_key in self.face_cache:
-            cached_path, quality = self.face_cache[cache_key]
-            if self.verify_image(cached_path):
-                logger.debug(f"Using cached extracted face (quality: {quality:.2f})")
-                return cached_path, quality
-        
         try:
-            # Extract faces using better detector
+            # Extract faces using better detector (DeepFace expects BGR arrays)
             face_objs = DeepFace.extract_faces(
-                img_path=image_path,
+                img_path=_rgb_to_bgr(image),
                 detector_backend=self.detector_backend,
                 enforce_detection=False,
-                align=self.align_faces,
-                target_size=target_size
+                align=self.align_faces
             )
             
             if not face_objs:
@@ -258,49 +379,48 @@ class FaceRecognitionService:
             if face_img.max() <= 1.0:
                 face_img = (face_img * 255).astype(np.uint8)
             
-            # Save to temporary file
-            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.jpg')
-            face_pil = Image.fromarray(face_img)
-            face_pil.save(temp_file.name, 'JPEG', quality=95)
-            temp_file.close()
-            
-            # Cache the result
-            if self.cache_images:
-                self.face_cache[cache_key] = (temp_file.name, best_quality)
-            
-            return temp_file.name, best_quality
+            return face_img, best_quality
             
         except Exception as e:
             logger.debug(f"Face extraction failed: {str(e)[:100]}")
             return None
     
-    def preprocess_image(self, image_path: str) -> Tuple[str, float]:
+    def preprocess_image(self, image_path: str) -> Optional[Tuple[np.ndarray, float]]:
         """
         Preprocess image with enhancement and face extraction.
-        Returns (processed_path, quality_score).
+        Returns (processed_rgb_array, quality_score) or None if unreadable.
         """
+        if self.cache_images and image_path in self.face_cache:
+            return self.face_cache[image_path]
+        
+        image = self.load_image(image_path)
+        if image is None:
+            return None
+        
         # Enhance image if enabled
         if self.enhance_images:
-            enhanced_path = self.enhance_image_quality(image_path)
-        else:
-            enhanced_path = image_path
+            image = self.enhance_image_quality(image)
         
         # Extract face if enabled
+        result = None
         if self.extract_faces:
-            result = self.extract_best_face(enhanced_path)
-            if result:
-                return result
-            else:
+            result = self.extract_best_face(image)
+            if not result:
                 logger.debug("Using original image (no face extracted)")
-                return enhanced_path, 0.5
+                result = (image, 0.5)
         else:
-            return enhanced_path, 1.0
+            result = (image, 1.0)
+        
+        if self.cache_images:
+            self.face_cache[image_path] = result
+        
+        return result
     
     def load_linkedin_profiles(self, json_file_path: str) -> List[Dict[str, Any]]:
         """Load LinkedIn profile data from JSON file."""
         try:
-            with open(json_file_path, 'r') as f:
-                profiles = json.load(f)
+            with open(json_file_path, 'rb') as f:
+                profiles = orjson.loads(f.read())
             
             standardized_profiles = []
             for profile in profiles:
@@ -314,8 +434,7 @@ class FaceRecognitionService:
                     "connections": profile.get("connections", ""),
                     "about": profile.get("about", ""),
                     "experience": profile.get("experience", []),
-                    "education": profile.get("education", []),
-                    "raw_profile": profile
+                    "education": profile.get("education", [])
                 }
                 standardized_profiles.append(standardized)
             
@@ -326,9 +445,33 @@ class FaceRecognitionService:
             logger.error(f"Error loading LinkedIn profiles: {e}")
             return []
     
+    def result_profile(self, profile: Dict[str, Any]) -> Dict[str, Any]:
+        """Compact projection of a profile for match results."""
+        return {field: profile.get(field, '') for field in self.RESULT_FIELDS}
+    
+    def uses_onnx(self, model_name: str) -> bool:
+        """Whether embeddings for model_name come from the ONNX embedder."""
+        return self.onnx_session is not None and model_name == self.model_name
+    
+    def embedding_space(self, model_name: str) -> str:
+        """
+        Name of the embedding space model_name produces, used for the
+        in-memory and on-disk caches. The ONNX embedder gets its own space,
+        keyed by the model file hash, so its vectors never mix with DeepFace's.
+        """
+        if self.uses_onnx(model_name):
+            return f"{model_name}-onnx-{self.onnx_model_id}"
+        return model_name
+    
+    def model_threshold(self, model_name: str) -> float:
+        """Cosine distance threshold of model_name (onnx_threshold for the ONNX embedder)."""
+        if self.uses_onnx(model_name):
+            return self.onnx_threshold
+        return self.THRESHOLDS.get(model_name, 0.40)
+    
     def calculate_confidence(self, distance: float, model_name: str, quality1: float = 1.0, quality2: float = 1.0) -> float:
         """Calculate confidence score from distance and quality."""
-        threshold = self.THRESHOLDS.get(model_name, 0.40)
+        threshold = self.model_threshold(model_name)
         
         # Base confidence from distance
         if distance < threshold:
@@ -342,33 +485,183 @@ class FaceRecognitionService:
         
         return max(0, min(1.0, adjusted_confidence))
     
-    def compare_faces_single_model(
+    def calculate_confidences(
         self,
-        img1_path: str,
-        img2_path: str,
+        distances: np.ndarray,
         model_name: str,
-        quality1: float = 1.0,
-        quality2: float = 1.0
-    ) -> Optional[Dict[str, Any]]:
-        """Compare two faces using a single model."""
+        quality1: float,
+        qualities2: np.ndarray
+    ) -> np.ndarray:
+        """Vectorized calculate_confidence over an array of distances."""
+        threshold = self.model_threshold(model_name)
+        
+        base_confidence = np.where(
+            distances < threshold,
+            1.0 - (distances / threshold) * 0.5,
+            np.maximum(0, 0.5 - (distances - threshold) / threshold * 0.5)
+        )
+        
+        quality_factor = (quality1 + qualities2) / 2.0
+        adjusted_confidence = base_confidence * (0.7 + 0.3 * quality_factor)
+        
+        return np.clip(adjusted_confidence, 0, 1.0)
+    
+    def get_embedding(
+        self,
+        image: np.ndarray,
+        model_name: str,
+        cache_key: Optional[str] = None
+    ) -> Optional[np.ndarray]:
+        """Compute the L2-normalized embedding of an RGB image for a model."""
+        return self.get_embeddings_batch([image], model_name, [cache_key])[0]
+    
+    def get_embeddings_batch(
+        self,
+        images: List[np.ndarray],
+        model_name: str,
+        cache_keys: Optional[List[Optional[str]]] = None
+    ) -> List[Optional[np.ndarray]]:
+        """
+        Compute L2-normalized embeddings for many RGB images with one batched
+        DeepFace.represent call. Returns a list aligned with images, holding
+        None for images that could not be embedded. Embeddings of images
+        with a cache key are kept in embedding_cache.
+        """
+        if cache_keys is None:
+            cache_keys = [None] * len(images)
+        
+        space = self.embedding_space(model_name)
+        embeddings = [
+            self.embedding_cache.get((space, key)) if key is not None else None
+            for key in cache_keys
+        ]
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        
+        if not missing:
+            return embeddings
+        
+        if self.uses_onnx(model_name):
+            try:
+                batch = self._onnx_embed([images[i] for i in missing])
+            except Exception as e:
+                logger.debug(f"ONNX embedding failed: {str(e)[:100]}")
+                return embeddings
+            
+            for i, raw in zip(missing, batch):
+                embedding = _l2_normalize(raw.astype(np.float32))
+                if embedding is None:
+                    continue
+                embeddings[i] = embedding
+                if cache_keys[i] is not None:
+                    self.embedding_cache[(space, cache_keys[i])] = embedding
+            
+            return embeddings
+        
         try:
-            result = DeepFace.verify(
-                img1_path=img1_path,
-                img2_path=img2_path,
+            batch = DeepFace.represent(
+                img_path=[_rgb_to_bgr(images[i]) for i in missing],
                 model_name=model_name,
-                distance_metric=self.distance_metric,
                 enforce_detection=self.enforce_detection,
                 detector_backend=self.detector_backend
             )
+        except Exception as e:
+            # One bad image fails the whole batch; retry the misses one by one
+            logger.debug(f"Batched embedding failed with {model_name}: {str(e)[:100]}")
+            if len(missing) == 1:
+                return embeddings
+            for i in missing:
+                embeddings[i] = self.get_embedding(images[i], model_name, cache_keys[i])
+            return embeddings
+        
+        if batch and isinstance(batch[0], dict):
+            batch = [batch]
+        
+        for i, representations in zip(missing, batch):
+            if not representations:
+                continue
+            embedding = _l2_normalize(np.asarray(representations[0]['embedding'], dtype=np.float32))
+            if embedding is None:
+                continue
+            embeddings[i] = embedding
+            if cache_keys[i] is not None:
+                self.embedding_cache[(space, cache_keys[i])] = embedding
+        
+        return embeddings
+    
+    def _onnx_embed(self, images: List[np.ndarray]) -> np.ndarray:
+        """
+        Embed RGB face crops with the ONNX session in one batched run.
+        Input size and layout (NCHW or NHWC) are read from the model; pixels
+        are scaled to [-1, 1]. No detection is done here, so images should
+        already be face crops (extract_faces=True).
+        """
+        model_input = self.onnx_session.get_inputs()[0]
+        shape = model_input.shape
+        channels_first = shape[1] == 3
+        height, width = (shape[2], shape[3]) if channels_first else (shape[1], shape[2])
+        height = height if isinstance(height, int) else 112
+        width = width if isinstance(width, int) else 112
+        
+        batch = np.stack([
+            cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+            for image in images
+        ]).astype(np.float32)
+        batch = (batch - 127.5) / 127.5
+        if channels_first:
+            batch = batch.transpose(0, 3, 1, 2)
+        batch = np.ascontiguousarray(batch)
+        
+        # Models exported with a fixed batch size of 1 are run image by image
+        if shape[0] == 1 and len(images) > 1:
+            return np.concatenate([self._onnx_run(batch[i:i + 1]) for i in range(len(images))])
+        
+        return self._onnx_run(batch)
+    
+    def _onnx_run(self, batch: np.ndarray) -> np.ndarray:
+        """
+        Run the ONNX session on a contiguous batch. On CUDA the batch is
+        bound to device memory with a single host-to-device copy and the
+        embeddings come back with a single device-to-host copy, instead of
+        letting session.run stage every input and output itself.
+        """
+        input_name = self.onnx_session.get_inputs()[0].name
+        
+        if self.onnx_session.get_providers()[0] != 'CUDAExecutionProvider':
+            return self.onnx_session.run(None, {input_name: batch})[0]
+        
+        binding = self.onnx_session.io_binding()
+        binding.bind_ortvalue_input(input_name, ort.OrtValue.ortvalue_from_numpy(batch, 'cuda', 0))
+        binding.bind_output(self.onnx_session.get_outputs()[0].name, 'cuda', 0)
+        self.onnx_session.run_with_iobinding(binding)
+        return binding.copy_outputs_to_cpu()[0]
+    
+    def compare_faces_single_model(
+        self,
+        img1: np.ndarray,
+        img2: np.ndarray,
+        model_name: str,
+        quality1: float = 1.0,
+        quality2: float = 1.0
+    ) -> Optional[Dict[str, Any]]:
+        """Compare two faces using a single model (cosine distance on embeddings)."""
+        try:
+            embedding1 = self.get_embedding(img1, model_name)
+            if embedding1 is None:
+                return None
             
-            distance = result['distance']
+            embedding2 = self.get_embedding(img2, model_name)
+            if embedding2 is None:
+                return None
+            
+            distance = 1.0 - float(np.dot(embedding1, embedding2))
             confidence = self.calculate_confidence(distance, model_name, quality1, quality2)
+            threshold = self.model_threshold(model_name)
             
             return {
                 'distance': distance,
                 'confidence': confidence,
-                'verified': result.get('verified', False),
-                'threshold': result.get('threshold', self.THRESHOLDS.get(model_name, 0.40)),
+                'verified': distance <= threshold,
+                'threshold': threshold,
                 'model': model_name
             }
             
@@ -378,8 +671,8 @@ class FaceRecognitionService:
     
     def compare_faces_ensemble(
         self,
-        img1_path: str,
-        img2_path: str,
+        img1: np.ndarray,
+        img2: np.ndarray,
         quality1: float = 1.0,
         quality2: float = 1.0
     ) -> Optional[Dict[str, Any]]:
@@ -387,29 +680,23 @@ class FaceRecognitionService:
         results = []
         
         for model in self.ensemble_models:
-            result = self.compare_faces_single_model(img1_path, img2_path, model, quality1, quality2)
+            result = self.compare_faces_single_model(img1, img2, model, quality1, quality2)
             if result:
                 results.append(result)
         
+        return self.combine_model_results(results)
+    
+    def combine_model_results(self, results: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Combine per-model comparison results by weighted voting."""
         if not results:
             return None
         
-        # Weighted voting based on model reliability
-        weights = {
-            'Facenet512': 1.5,
-            'ArcFace': 1.5,
-            'VGG-Face': 1.0,
-            'Facenet': 1.0,
-            'OpenFace': 0.8,
-            'DeepFace': 1.0
-        }
-        
         total_confidence = 0
         total_weight = 0
         distances = []
         
         for result in results:
-            weight = weights.get(result['model'], 1.0)
+            weight = self.MODEL_WEIGHTS.get(result['model'], 1.0)
             total_confidence += result['confidence'] * weight
             total_weight += weight
             distances.append(result['distance'])
@@ -438,77 +725,449 @@ class FaceRecognitionService:
         """Compare two faces with preprocessing and optional ensemble."""
         try:
             # Preprocess both images
-            processed_img1, quality1 = self.preprocess_image(img1_path)
-            processed_img2, quality2 = self.preprocess_image(img2_path)
-            
-            logger.debug(f"Image qualities: {quality1:.2f}, {quality2:.2f}")
-            
-            # Use ensemble or single model
-            if self.use_ensemble:
-                result = self.compare_faces_ensemble(processed_img1, processed_img2, quality1, quality2)
-            else:
-                result = self.compare_faces_single_model(
-                    processed_img1, processed_img2, self.model_name, quality1, quality2
-                )
+            processed1 = self.preprocess_image(img1_path)
+            processed2 = self.preprocess_image(img2_path)
+            if not processed1 or not processed2:
+                return None
             
-            if result:
-                result['quality1'] = quality1
-                result['quality2'] = quality2
+            processed_img1, quality1 = processed1
+            processed_img2, quality2 = processed2
             
-            return result
+            return self.compare_preprocessed(processed_img1, quality1, processed_img2, quality2)
             
         except Exception as e:
             logger.debug(f"Face comparison failed: {str(e)[:100]}")
             return None
     
-    def process_single_profile(
+    def compare_preprocessed(
         self,
-        profile: Dict[str, Any],
-        target_image_path: str,
-        image_field: str,
-        index: int,
-        total: int
+        processed_img1: np.ndarray,
+        quality1: float,
+        processed_img2: np.ndarray,
+        quality2: float
     ) -> Optional[Dict[str, Any]]:
-        """Process a single profile comparison."""
-        if image_field not in profile or not profile[image_field]:
+        """Compare two already preprocessed faces with optional ensemble."""
+        logger.debug(f"Image qualities: {quality1:.2f}, {quality2:.2f}")
+        
+        # Use ensemble or single model
+        if self.use_ensemble:
+            result = self.compare_faces_ensemble(processed_img1, processed_img2, quality1, quality2)
+        else:
+            result = self.compare_faces_single_model(
+                processed_img1, processed_img2, self.model_name, quality1, quality2
+            )
+        
+        if result:
+            result['quality1'] = quality1
+            result['quality2'] = quality2
+        
+        return result
+    
+    def prefetch_images(self, urls: List[Optional[str]]) -> List[Optional[str]]:
+        """
+        Download many images concurrently.
+        Fetching is network-bound, so threads overlap the HTTP latencies.
+        Returns local paths aligned with urls (None where download failed).
+        """
+        if not urls:
+            return []
+        
+        with ThreadPoolExecutor(max_workers=self.download_workers) as executor:
+            return list(executor.map(self.download_and_cache_image, urls))
+    
+    def profile_cache_key(self, profile: Dict[str, Any], image_field: str) -> Optional[str]:
+        """Stable per-profile key for the embedding cache (LinkedIn id, else image URL hash)."""
+        linkedin_id = profile.get('linkedin_id')
+        if linkedin_id:
+            return str(linkedin_id)
+        
+        image_url = profile.get(image_field)
+        if image_url:
+            return hashlib.sha1(image_url.encode()).hexdigest()
+        
+        return None
+    
+    def _embedding_store_dir(self, model_name: str) -> Path:
+        """
+        Directory of a model's embedding store. Embeddings depend on the
+        preprocessing settings as well as the embedding space, so those are
+        part of the name.
+        """
+        settings = (
+            f"{self.detector_backend}-{self.enhance_images:d}{self.extract_faces:d}"
+            f"{self.align_faces:d}{self.enforce_detection:d}-q{self.face_quality_threshold:g}"
+        )
+        return Path(self.embedding_cache_dir) / f"{self.embedding_space(model_name)}-{settings}"
+    
+    def _embedding_store(self, model_name: str) -> Dict[str, Any]:
+        """
+        Open (once per instance) the on-disk embedding store of a model.
+        Embeddings live in one contiguous float32 (N, D) matrix file,
+        memory-mapped read-only, with the keys and image qualities of its
+        rows kept separately in index.json. With quantize_embeddings the
+        int8 copy of the matrix (embeddings.i8, scales.f32) is mapped as well.
+        """
+        if model_name in self._embedding_stores:
+            return self._embedding_stores[model_name]
+        
+        store = {
+            'keys': [], 'rows': {}, 'matrix': None, 'quantized': None, 'scales': None,
+            'qualities': [], 'dim': None, 'pending': {}, 'ann': None
+        }
+        store_dir = self._embedding_store_dir(model_name)
+        
+        try:
+            index_path = store_dir / 'index.json'
+            if index_path.exists():
+                with open(index_path, 'rb') as f:
+                    index = orjson.loads(f.read())
+                keys = index['keys']
+                if keys:
+                    store['matrix'] = np.memmap(
+                        store_dir / 'embeddings.f32', dtype=np.float32, mode='r',
+                        shape=(len(keys), index['dim'])
+                    )
+                store['keys'] = keys
+                store['rows'] = {key: row for row, key in enumerate(keys)}
+                store['qualities'] = np.asarray(index['qualities'], dtype=np.float32)
+                store['dim'] = index['dim']
+                if keys and self.quantize_embeddings:
+                    store['quantized'], store['scales'] = self._quantized_store_rows(store_dir, store['matrix'])
+        except Exception as e:
+            logger.debug(f"Failed to open embedding store {store_dir}: {e}")
+            store = {
+                'keys': [], 'rows': {}, 'matrix': None, 'quantized': None, 'scales': None,
+                'qualities': [], 'dim': None, 'pending': {}, 'ann': None
+            }
+        
+        self._embedding_stores[model_name] = store
+        return store
+    
+    def _quantized_store_rows(self, store_dir: Path, matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Memory-map the int8 rows and per-row scales of a store. They are
+        written alongside the float32 matrix by quantized runs; when missing
+        or behind it (the store grew in a float32 run) they are rebuilt from
+        the matrix once.
+        """
+        quantized_path = store_dir / 'embeddings.i8'
+        scales_path = store_dir / 'scales.f32'
+        
+        in_step = (
+            quantized_path.exists() and scales_path.exists()
+            and quantized_path.stat().st_size == matrix.size
+            and scales_path.stat().st_size == matrix.shape[0] * 4
+        )
+        if not in_step:
+            quantized, scales = _quantize_int8(matrix)
+            quantized.tofile(quantized_path)
+            scales.tofile(scales_path)
+        
+        return (
+            np.memmap(quantized_path, dtype=np.int8, mode='r', shape=matrix.shape),
+            np.memmap(scales_path, dtype=np.float32, mode='r', shape=(matrix.shape[0],))
+        )
+    
+    def load_cached_embeddings(
+        self,
+        model_name: str,
+        keys: List[Optional[str]]
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, Optional[np.ndarray], np.ndarray]:
+        """
+        Load the stored embeddings of every key found in the on-disk store.
+        Returns (indices into keys, their store rows, (hits, D) embedding
+        block, per-row int8 scales, qualities); the block is gathered from
+        the memory-mapped matrix in one read. With quantize_embeddings the block holds the
+        stored int8 rows, otherwise float32 rows and scales is None.
+        """
+        dtype = np.int8 if self.quantize_embeddings else np.float32
+        store = self._embedding_store(model_name) if self.embedding_cache_dir else None
+        hits = [(i, store['rows'][key]) for i, key in enumerate(keys) if key in store['rows']] if store else []
+        if not hits:
+            scales = np.empty(0, dtype=np.float32) if self.quantize_embeddings else None
+            dim = (store and store['dim']) or 0
+            empty = np.empty(0, dtype=np.intp)
+            return empty, empty, np.empty((0, dim), dtype=dtype), scales, np.empty(0, dtype=np.float32)
+        
+        positions, rows = (np.array(column, dtype=np.intp) for column in zip(*hits))
+        if self.quantize_embeddings:
+            return positions, rows, store['quantized'][rows], store['scales'][rows], store['qualities'][rows]
+        return positions, rows, store['matrix'][rows], None, store['qualities'][rows]
+    
+    def store_cached_embedding(self, model_name: str, key: Optional[str], embedding: np.ndarray, quality: float):
+        """Queue (embedding, quality) for the on-disk store; see flush_cached_embeddings."""
+        if not self.embedding_cache_dir or not key:
+            return
+        
+        store = self._embedding_store(model_name)
+        if store['dim'] is not None and store['dim'] != embedding.shape[0]:
+            logger.debug(f"Embedding size mismatch for {model_name}, not caching")
+            return
+        if key not in store['rows']:
+            store['pending'][key] = (embedding.astype(np.float32), quality)
+    
+    def flush_cached_embeddings(self, model_name: str):
+        """Append queued embeddings to the model's store, then remap it."""
+        if not self.embedding_cache_dir:
+            return
+        
+        store = self._embedding_store(model_name)
+        if not store['pending']:
+            return
+        
+        store_dir = self._embedding_store_dir(model_name)
+        
+        try:
+            store_dir.mkdir(parents=True, exist_ok=True)
+            keys = list(store['keys'])
+            pending = store['pending']
+            rows = np.stack([embedding for embedding, _ in pending.values()])
+            with open(store_dir / 'embeddings.f32', 'ab') as f:
+                # Drop trailing rows that never made it into the index
+                f.truncate(len(keys) * rows.shape[1] * 4)
+                f.write(rows.tobytes())
+            
+            # Keep the int8 copy in step; stores opened out of step are rebuilt on the next open
+            if self.quantize_embeddings and (store['quantized'] is not None or not keys):
+                quantized, scales = _quantize_int8(rows)
+                with open(store_dir / 'embeddings.i8', 'ab') as f:
+                    f.truncate(len(keys) * rows.shape[1])
+                    f.write(quantized.tobytes())
+                with open(store_dir / 'scales.f32', 'ab') as f:
+                    f.truncate(len(keys) * 4)
+                    f.write(scales.tobytes())
+            
+            keys += list(pending)
+            qualities = list(map(float, store['qualities'])) + [quality for _, quality in pending.values()]
+            
+            # Rows are written before the index, so the index never points past the file
+            temp_index = store_dir / 'index.json.tmp'
+            with open(temp_index, 'wb') as f:
+                f.write(orjson.dumps({'dim': rows.shape[1], 'keys': keys, 'qualities': qualities}))
+            temp_index.replace(store_dir / 'index.json')
+            
+            self._update_ann_index(store_dir, len(keys) - len(pending), rows)
+        except Exception as e:
+            logger.debug(f"Failed to write embedding store {store_dir}: {e}")
+        
+        del self._embedding_stores[model_name]
+    
+    def _update_ann_index(self, store_dir: Path, previous_rows: int, new_rows: np.ndarray):
+        """
+        Keep the store's FAISS HNSW index (profiles.faiss) in step with its
+        matrix. Built once the store reaches ANN_MIN_PROFILES rows, then
+        extended with each flush.
+        """
+        total_rows = previous_rows + new_rows.shape[0]
+        if faiss is None or total_rows < self.ANN_MIN_PROFILES:
+            return
+        
+        index_path = store_dir / 'profiles.faiss'
+        index = faiss.read_index(str(index_path)) if index_path.exists() else None
+        
+        if index is not None and index.ntotal == previous_rows:
+            index.add(new_rows)
+        else:
+            # Missing or out of step with the matrix: rebuild from every row
+            matrix = np.memmap(
+                store_dir / 'embeddings.f32', dtype=np.float32, mode='r',
+                shape=(total_rows, new_rows.shape[1])
+            )
+            index = faiss.IndexHNSWFlat(new_rows.shape[1], 32, faiss.METRIC_INNER_PRODUCT)
+            index.add(np.ascontiguousarray(matrix))
+        
+        faiss.write_index(index, str(index_path))
+    
+    def ann_shortlist(
+        self,
+        model_name: str,
+        target_embedding: np.ndarray,
+        store_rows: np.ndarray,
+        k: int
+    ) -> Optional[np.ndarray]:
+        """
+        Indices into store_rows (-1 for rows not in the store) of the k
+        nearest of those profiles to the target, using the store's FAISS
+        index restricted to store_rows. Returns None when no index matches
+        the store or fewer than k of the profiles are found, in which case
+        callers fall back to exhaustive scoring.
+        """
+        if faiss is None or not self.embedding_cache_dir:
             return None
         
-        image_url = profile[image_field]
-        name = profile.get('name', 'Unknown')
+        store = self._embedding_store(model_name)
+        if store['ann'] is None:
+            index_path = self._embedding_store_dir(model_name) / 'profiles.faiss'
+            if not index_path.exists():
+                return None
+            try:
+                store['ann'] = faiss.read_index(str(index_path))
+            except Exception as e:
+                logger.debug(f"Failed to read FAISS index {index_path}: {e}")
+                return None
+        
+        index = store['ann']
+        if index.ntotal != len(store['keys']):
+            return None
+        
+        candidates = store_rows[store_rows >= 0].astype(np.int64)
+        if candidates.size < k:
+            return None
         
-        logger.info(f"\n[{index+1}/{total}] Processing: {name}")
+        # Search only the current profiles' rows of the (possibly larger) store
+        params = faiss.SearchParametersHNSW(sel=faiss.IDSelectorBatch(candidates))
+        _, neighbours = index.search(target_embedding[None, :].astype(np.float32), k, params=params)
         
-        profile_img_path = self.download_and_cache_image(image_url)
+        neighbours = neighbours[0][neighbours[0] >= 0]
+        if neighbours.size < k:
+            return None
+        return np.flatnonzero(np.isin(store_rows, neighbours))
+    
+    def ensemble_shortlist(
+        self,
+        profile_embeddings: Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray, Optional[np.ndarray]]],
+        target_embeddings: Dict[str, np.ndarray],
+        count: int,
+        k: int
+    ) -> Optional[np.ndarray]:
+        """
+        Mask over the count profiles to score exactly on very large profile
+        sets: the union of every model's ANN shortlist, plus profiles missing
+        from a store (and so from its index). Every model scores the same
+        profiles, so ensemble confidences stay averaged over the same models.
+        Returns None (score everything) below ANN_MIN_PROFILES or when any
+        model has no usable index.
+        """
+        if not target_embeddings:
+            return None
         
+        shortlisted = np.zeros(count, dtype=bool)
+        for model, target_embedding in target_embeddings.items():
+            rows, store_rows, _, _ = profile_embeddings[model]
+            if rows.size < self.ANN_MIN_PROFILES:
+                return None
+            
+            shortlist = self.ann_shortlist(model, target_embedding, store_rows, k)
+            if shortlist is None:
+                return None
+            
+            shortlisted[rows[shortlist]] = True
+            shortlisted[rows[store_rows < 0]] = True
+        
+        return shortlisted
+    
+    def prepare_profile_image(
+        self,
+        profile: Dict[str, Any],
+        profile_img_path: Optional[str]
+    ) -> Optional[Tuple[np.ndarray, float]]:
+        """
+        Preprocess a single downloaded profile image.
+        Returns (processed_rgb_array, quality_score) or None.
+        """
         if not profile_img_path:
-            logger.warning(f"  ⚠️  Could not load image")
             return None
         
         try:
-            result = self.compare_faces(target_image_path, profile_img_path)
-            
-            if result:
-                match_data = {
-                    'profile': profile.copy(),
-                    'distance': result['distance'],
-                    'confidence': result['confidence'],
-                    'verified': result['verified'],
-                    'threshold': result['threshold'],
-                    'quality1': result.get('quality1', 1.0),
-                    'quality2': result.get('quality2', 1.0)
+            return self.preprocess_image(profile_img_path)
+        except Exception as e:
+            tqdm.write(f"  ⚠️  {profile.get('name', 'Unknown')}: {str(e)[:100]}")
+            return None
+    
+    def collect_profile_embeddings(
+        self,
+        profiles: List[Dict[str, Any]],
+        image_field: str,
+        models: List[str]
+    ) -> Tuple[Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray, Optional[np.ndarray]]], np.ndarray]:
+        """
+        Get embeddings for every profile and model.
+        Embeddings come from the on-disk cache where possible; only profiles
+        with a miss are downloaded, preprocessed and embedded (one batched
+        forward pass per model). Returns ({model: (profile indices, store
+        rows, (n, D) embedding block, int8 scales or None)}, image quality
+        per profile); see load_cached_embeddings.
+        """
+        keys = [self.profile_cache_key(profile, image_field) for profile in profiles]
+        cached = {}
+        embedded = {model: np.zeros(len(profiles), dtype=bool) for model in models}
+        qualities = np.ones(len(profiles), dtype=np.float32)
+        
+        for model in models:
+            positions, store_rows, block, scales, block_qualities = self.load_cached_embeddings(model, keys)
+            cached[model] = (positions, store_rows, block, scales)
+            embedded[model][positions] = True
+            qualities[positions] = block_qualities
+        
+        pending = [
+            i for i, profile in enumerate(profiles)
+            if profile.get(image_field) and not all(embedded[model][i] for model in models)
+        ]
+        
+        if len(pending) < len(profiles):
+            logger.info(f"💾 Embedding cache hits: {len(profiles) - len(pending)}/{len(profiles)} profiles")
+        
+        if not pending:
+            return cached, qualities
+        
+        # Download every missing profile image concurrently, then preprocess them
+        image_urls = [profiles[i][image_field] for i in pending]
+        downloaded = self.prefetch_images(image_urls)
+        
+        failed_downloads = sum(1 for path in downloaded if not path)
+        if failed_downloads:
+            logger.warning(f"  ⚠️  Could not load {failed_downloads}/{len(pending)} images")
+        
+        prepared = [None] * len(pending)
+        
+        if self.use_parallel:
+            logger.info(f"⚡ Using parallel processing with {self.max_workers} workers")
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = {
+                    executor.submit(
+                        self.prepare_profile_image,
+                        profiles[i], downloaded[k]
+                    ): k for k, i in enumerate(pending)
                 }
                 
-                logger.info(f"  ✓ Distance: {result['distance']:.4f}, Confidence: {result['confidence']:.2%}")
-                
-                if self.use_ensemble:
-                    logger.info(f"  📊 Ensemble: {result.get('num_models', 0)} models")
-                
-                return match_data
+                for future in tqdm(as_completed(futures), total=len(futures), desc="preprocessing"):
+                    prepared[futures[future]] = future.result()
+        else:
+            for k, i in enumerate(tqdm(pending, desc="preprocessing")):
+                prepared[k] = self.prepare_profile_image(profiles[i], downloaded[k])
+        
+        ready = [(i, item) for i, item in zip(pending, prepared) if item]
+        
+        for i, (_, quality) in ready:
+            qualities[i] = quality
+        
+        embeddings = {}
+        for model in models:
+            missing = [(i, image) for i, (image, _) in ready if not embedded[model][i]]
+            batch = self.get_embeddings_batch(
+                [image for _, image in missing], model, [keys[i] for i, _ in missing]
+            )
+            fresh = [(i, embedding) for (i, _), embedding in zip(missing, batch) if embedding is not None]
+            for i, embedding in fresh:
+                self.store_cached_embedding(model, keys[i], embedding, float(qualities[i]))
+            self.flush_cached_embeddings(model)
             
-        except Exception as e:
-            logger.warning(f"  ⚠️  Error: {str(e)[:100]}")
+            # Cached block first, then the newly embedded rows
+            positions, store_rows, block, scales = cached[model]
+            if fresh:
+                positions = np.concatenate([positions, np.array([i for i, _ in fresh], dtype=np.intp)])
+                stored = self._embedding_store(model)['rows'] if self.embedding_cache_dir else {}
+                store_rows = np.concatenate([
+                    store_rows, np.array([stored.get(keys[i], -1) for i, _ in fresh], dtype=np.intp)
+                ])
+                rows = np.stack([embedding for _, embedding in fresh])
+                if self.quantize_embeddings:
+                    rows, row_scales = _quantize_int8(rows)
+                    scales = np.concatenate([scales, row_scales])
+                block = np.concatenate([block.reshape(-1, rows.shape[1]), rows])
+            embeddings[model] = (positions, store_rows, block, scales)
         
-        return None
+        return embeddings, qualities
     
     def find_best_match(
         self,
@@ -534,56 +1193,122 @@ class FaceRecognitionService:
             logger.error("❌ No profiles loaded")
             return None
         
-        matches = []
+        # Preprocess the target once; it is embedded alongside the profiles
+        processed_target = self.preprocess_image(target_image_path)
+        if not processed_target:
+            logger.error("❌ Target image preprocessing failed")
+            return None
         
-        # Parallel or sequential processing
-        if self.use_parallel:
-            logger.info(f"⚡ Using parallel processing with {self.max_workers} workers")
-            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-                futures = {
-                    executor.submit(
-                        self.process_single_profile,
-                        profile, target_image_path, image_field, i, len(profiles)
-                    ): i for i, profile in enumerate(profiles)
-                }
-                
-                for future in as_completed(futures):
-                    result = future.result()
-                    if result:
-                        matches.append(result)
-        else:
-            for i, profile in enumerate(profiles):
-                result = self.process_single_profile(
-                    profile, target_image_path, image_field, i, len(profiles)
-                )
-                if result:
-                    matches.append(result)
+        target_image, target_quality = processed_target
+        models = self.ensemble_models if self.use_ensemble else [self.model_name]
+        
+        profile_embeddings, qualities = self.collect_profile_embeddings(profiles, image_field, models)
+        
+        # One matrix-vector product per model scores every profile against the target
+        n = len(profiles)
+        total_confidence = np.zeros(n, dtype=np.float32)
+        total_distance = np.zeros(n, dtype=np.float32)
+        total_threshold = np.zeros(n, dtype=np.float32)
+        total_weight = np.zeros(n, dtype=np.float32)
+        verified_count = np.zeros(n, dtype=np.int32)
+        num_models = np.zeros(n, dtype=np.int32)
+        
+        target_embeddings = {}
+        for model in models:
+            target_embedding = self.get_embedding(target_image, model)
+            if target_embedding is None:
+                logger.debug(f"Could not embed target with {model}")
+                continue
+            target_embeddings[model] = target_embedding
+        
+        shortlisted = self.ensemble_shortlist(
+            profile_embeddings, target_embeddings, n, max(self.ANN_CANDIDATES, return_top_n * 10)
+        )
+        
+        for model, target_embedding in target_embeddings.items():
+            rows, store_rows, E, scales = profile_embeddings[model]
+            
+            if shortlisted is not None:
+                keep = shortlisted[rows]
+                rows, E = rows[keep], E[keep]
+                if scales is not None:
+                    scales = scales[keep]
+            
+            if rows.size == 0:
+                continue
+            
+            if scales is not None:
+                distances = _int8_cosine_distances(E, scales, target_embedding)
+            else:
+                distances = _cosine_distances(E, target_embedding)
+            confidences = self.calculate_confidences(distances, model, target_quality, qualities[rows])
+            threshold = self.model_threshold(model)
+            weight = self.MODEL_WEIGHTS.get(model, 1.0)
+            
+            total_confidence[rows] += confidences * weight
+            total_distance[rows] += distances
+            total_threshold[rows] += threshold
+            total_weight[rows] += weight
+            verified_count[rows] += distances <= threshold
+            num_models[rows] += 1
+        
+        valid = np.flatnonzero(num_models > 0)
         
         logger.info(f"\n{'='*60}")
-        logger.info(f"Processed: {len(matches)}/{len(profiles)} profiles")
+        logger.info(f"Processed: {valid.size}/{len(profiles)} profiles")
         
-        if not matches:
+        if valid.size == 0:
             logger.warning("❌ No valid comparisons completed")
             return None
         
-        # Sort by confidence
-        matches.sort(key=lambda x: x['confidence'], reverse=True)
+        confidence = total_confidence[valid] / total_weight[valid]
         
         # Filter by minimum confidence
         if min_confidence > 0:
-            matches = [m for m in matches if m['confidence'] >= min_confidence]
-            logger.info(f"Matches above {min_confidence:.0%} confidence: {len(matches)}")
+            keep = confidence >= min_confidence
+            valid, confidence = valid[keep], confidence[keep]
+            logger.info(f"Matches above {min_confidence:.0%} confidence: {valid.size}")
         
-        if not matches:
+        if valid.size == 0:
             logger.warning(f"❌ No matches above {min_confidence:.0%} confidence threshold")
             return None
         
+        # Select the top N by confidence: argmax for a single match, otherwise
+        # an O(N) partition followed by sorting just the selected candidates
+        top_n = min(return_top_n, valid.size)
+        if top_n == 1:
+            order = np.array([np.argmax(confidence)])
+        else:
+            order = np.argpartition(-confidence, top_n - 1)[:top_n]
+            order = order[np.argsort(-confidence[order], kind='stable')]
+        
+        # Matches reference the loaded profiles by index; result_profile
+        # builds the only copy that leaves this method
+        matches = []
+        for j in valid[order]:
+            matches.append({
+                'profile': profiles[j],
+                'distance': float(total_distance[j] / num_models[j]),
+                'confidence': float(total_confidence[j] / total_weight[j]),
+                'verified': bool(verified_count[j] > num_models[j] / 2),
+                'threshold': float(total_threshold[j] / num_models[j]),
+                'quality1': target_quality,
+                'quality2': float(qualities[j])
+            })
+        total_found = valid.size
+        if shortlisted is not None and min_confidence <= 0:
+            # Profiles outside the shortlist were not scored but still rank
+            # (below it); with a confidence floor only scored ones can qualify
+            total_found = int(np.count_nonzero(np.bincount(
+                np.concatenate([profile_embeddings[model][0] for model in target_embeddings]), minlength=n
+            )))
+        
         # Show top matches
         logger.info(f"\n{'='*60}")
         logger.info(f"TOP {min(return_top_n, len(matches))} MATCH(ES)")
         logger.info(f"{'='*60}")
         
-        for idx, match in enumerate(matches[:return_top_n], 1):
+        for idx, match in enumerate(matches, 1):
             profile = match['profile']
             logger.info(f"\n#{idx} - {profile.get('name', 'Unknown')}")
             logger.info(f"    Headline: {profile.get('headline', 'N/A')}")
@@ -594,7 +1319,7 @@ class FaceRecognitionService:
         if return_top_n == 1:
             best = matches[0]
             return {
-                "matched_profile": best['profile'],
+                "matched_profile": self.result_profile(best['profile']),
                 "confidence": best['confidence'],
                 "face_distance": best['distance'],
                 "verified": best['verified']
@@ -603,14 +1328,14 @@ class FaceRecognitionService:
             return {
                 "matches": [
                     {
-                        "matched_profile": m['profile'],
+                        "matched_profile": self.result_profile(m['profile']),
                         "confidence": m['confidence'],
                         "face_distance": m['distance'],
                         "verified": m['verified']
                     }
-                    for m in matches[:return_top_n]
+                    for m in matches
                 ],
-                "total_found": len(matches)
+                "total_found": total_found
             }
     
     def find_all_matches(
@@ -659,6 +1384,15 @@ def main(json_data, target_img_data, **kwargs):
             - min_confidence: float (default: 0.0)
             - use_parallel: bool (default: False) - Speed up processing
             - max_workers: int (default: 4)
+            - download_workers: int (default: 16) - Concurrent image downloads
+            - embedding_cache_dir: str (default: <tmp>/face_recognition_embeddings) -
+              Reuse profile embeddings across runs, None disables
+            - quantize_embeddings: bool (default: False) - int8 similarity scoring,
+              only with numba installed (float32 is faster without it)
+            - onnx_model_path: str (default: None) - ONNX face embedder to use
+              for model_name instead of DeepFace (e.g. a quantized light CNN)
+            - onnx_threshold: float (default: None) - Cosine distance threshold
+              of the ONNX embedder, required with onnx_model_path
     """
     
     # Extract kwargs
@@ -676,6 +1410,14 @@ def main(json_data, target_img_data, **kwargs):
     face_quality_threshold = kwargs.get('face_quality_threshold', 0.0)
     use_parallel = kwargs.get('use_parallel', False)
     max_workers = kwargs.get('max_workers', 4)
+    download_workers = kwargs.get('download_workers', 16)
+    embedding_cache_dir = kwargs.get(
+        'embedding_cache_dir',
+        str(Path(tempfile.gettempdir()) / 'face_recognition_embeddings')
+    )
+    quantize_embeddings = kwargs.get('quantize_embeddings', False)
+    onnx_model_path = kwargs.get('onnx_model_path', None)
+    onnx_threshold = kwargs.get('onnx_threshold', None)
     
     service = FaceRecognitionService(
         model_name=model_name,
@@ -691,15 +1433,20 @@ def main(json_data, target_img_data, **kwargs):
         enhance_images=enhance_images,
         face_quality_threshold=face_quality_threshold,
         use_parallel=use_parallel,
-        max_workers=max_workers
+        max_workers=max_workers,
+        download_workers=download_workers,
+        embedding_cache_dir=embedding_cache_dir,
+        quantize_embeddings=quantize_embeddings,
+        onnx_model_path=onnx_model_path,
+        onnx_threshold=onnx_threshold
     )
     
     # Handle json_data
     if isinstance(json_data, str):
         profiles_json_path = json_data
     elif isinstance(json_data, list):
-        temp_json = tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False)
-        json.dump(json_data, temp_json)
+        temp_json = tempfile.NamedTemporaryFile(mode='wb', suffix='.json', delete=False)
+        temp_json.write(orjson.dumps(json_data))
         temp_json.close()
         profiles_json_path = temp_json.name
     else:
@@ -8,18 +8,30 @@ Matches a target face image against LinkedIn profile photos using DeepFace with
 import sys
 import json
 import base64
-import io
 import os
 from pathlib import Path
-from typing import Dict, List, Optional, Any, Tuple
-from deepface import DeepFace
-from PIL import Image, ImageEnhance
+from typing import Callable, Dict, List, Optional, Any, Tuple
 import numpy as np
+import cv2
+import h5py
 import hashlib
+import heapq
+import operator
+import xxhash
+from collections import OrderedDict
 import tempfile
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import aiohttp
+import asyncio
+import atexit
 import logging
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import queue
+import threading
+import multiprocessing
+from multiprocessing import shared_memory
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 
 # Redirect all library outputs to stderr to keep stdout clean for JSON
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'  # Suppress TensorFlow logs
@@ -33,27 +45,141 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Let TensorFlow grow GPU memory on demand instead of claiming the whole GPU,
+# so several service processes can share one device. This must run before
+# DeepFace initializes TensorFlow. FACE_RECOGNITION_GPU_MEMORY_MB sets a hard cap instead.
+import tensorflow as tf
+
+try:
+    gpu_memory_limit = os.environ.get('FACE_RECOGNITION_GPU_MEMORY_MB')
+    for gpu in tf.config.list_physical_devices('GPU'):
+        if gpu_memory_limit:
+            tf.config.set_logical_device_configuration(
+                gpu, [tf.config.LogicalDeviceConfiguration(memory_limit=int(gpu_memory_limit))]
+            )
+        else:
+            tf.config.experimental.set_memory_growth(gpu, True)
+except (RuntimeError, ValueError) as e:
+    logger.warning(f"Could not configure GPU memory: {e}")
+
+from deepface import DeepFace
+from deepface.modules import preprocessing
+
+# DeepFace builds its models with tf_keras (it sets TF_USE_LEGACY_KERAS on
+# import), so precision policies must be set there rather than on Keras 3
+try:
+    import tf_keras as keras
+except ImportError:  # TensorFlow < 2.16 ships Keras 2 as tf.keras
+    keras = tf.keras
+
+# FACE_RECOGNITION_MIXED_PRECISION=1 builds the recognition models in FP16 on
+# GPUs. Experimental: the cosine-distance drift of FP16 embeddings against FP32
+# has not been measured, and THRESHOLDS are tuned for FP32 and unvalidated for FP16
+MIXED_PRECISION = os.environ.get('FACE_RECOGNITION_MIXED_PRECISION', '0') == '1'
+
+# libjpeg-turbo decodes/encodes JPEGs with SIMD; OpenCV is the fallback
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR
+    turbo_jpeg = TurboJPEG()
+except Exception:
+    turbo_jpeg = None
+
 # Suppress warnings to stderr
 import warnings
 warnings.filterwarnings('ignore')
 
-# Redirect stdout temporarily to ensure only JSON is printed
-class StdoutFilter:
-    """Filter to prevent libraries from writing to stdout"""
-    def __init__(self):
-        self.original_stdout = sys.stdout
-        self.buffer = []
 
-    def write(self, text):
-        # Only allow our JSON output (starts with '{')
-        if text.strip().startswith('{'):
-            self.original_stdout.write(text)
-        elif text.strip():
-            # Redirect everything else to stderr
-            sys.stderr.write(text)
+def build_recognition_model(model_name: str):
+    """
+    DeepFace.build_model for a recognition model. With MIXED_PRECISION on a
+    GPU the model is built under the mixed_float16 policy (weights and
+    numerically sensitive ops stay FP32); the policy is restored afterwards
+    so the face detector and anything built later stay FP32.
+
+    Mixed precision is experimental: THRESHOLDS have only been validated for
+    FP32 embeddings, so verify the distance drift on a sample set (and adjust
+    the thresholds if needed) before relying on it.
+    """
+    if not (MIXED_PRECISION and tf.config.list_physical_devices('GPU')):
+        return DeepFace.build_model(model_name)
+
+    previous_policy = keras.mixed_precision.global_policy()
+    keras.mixed_precision.set_global_policy('mixed_float16')
+    try:
+        return DeepFace.build_model(model_name)
+    finally:
+        keras.mixed_precision.set_global_policy(previous_policy)
+
+
+def quantize_embeddings(embeddings: np.ndarray) -> np.ndarray:
+    """
+    Symmetric per-vector int8 quantization of an (N, D) embedding matrix, for
+    storage. Each row is scaled to fill [-127, 127]; the scales are dropped
+    since cosine similarity ignores vector length.
+    """
+    scales = np.abs(embeddings).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    return np.round(embeddings / scales[:, None]).astype(np.int8)
+
+
+def url_key(url: str) -> int:
+    """Cheap 64-bit cache key for an image URL."""
+    return xxhash.xxh64_intdigest(url.encode())
+
+
+def decode_image_bytes(data: bytes) -> Optional[np.ndarray]:
+    """Decode encoded image bytes to a BGR uint8 array (None if undecodable)."""
+    if turbo_jpeg is not None and data[:2] == b'\xff\xd8':
+        try:
+            return turbo_jpeg.decode(data, pixel_format=TJPF_BGR)
+        except Exception:
+            pass
 
-    def flush(self):
-        self.original_stdout.flush()
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+def encode_jpeg(img: np.ndarray, quality: int = 95) -> bytes:
+    """Encode a BGR uint8 array as JPEG bytes."""
+    if turbo_jpeg is not None:
+        return turbo_jpeg.encode(img, quality=quality, pixel_format=TJPF_BGR)
+
+    ok, buffer = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("JPEG encoding failed")
+    return buffer.tobytes()
+
+
+class LruCache(OrderedDict):
+    """Dict that keeps at most maxsize entries, evicting the least recently used."""
+
+    def __init__(self, maxsize: int):
+        super().__init__()
+        self.maxsize = maxsize
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        self.move_to_end(key)
+        return value
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        while len(self) > self.maxsize:
+            _, evicted = self.popitem(last=False)
+            self.evict(evicted)
+
+    def evict(self, value):
+        """Hook called with each evicted value."""
+
+
+class LruPathCache(LruCache):
+    """LruCache of tempfile paths that deletes the files it evicts."""
+
+    def evict(self, value):
+        try:
+            os.unlink(value)
+        except OSError:
+            pass
 
 
 class FaceRecognitionService:
@@ -72,6 +198,62 @@ class FaceRecognitionService:
         'SFace': 0.593
     }
 
+    # Ensemble voting weights based on model reliability
+    MODEL_WEIGHTS = {
+        'Facenet512': 1.5,
+        'ArcFace': 1.5,
+        'VGG-Face': 1.0,
+        'Facenet': 1.0,
+        'OpenFace': 0.8,
+        'DeepFace': 1.0
+    }
+
+    # Approximate relative inference cost (input size x network depth);
+    # the ensemble runs cheaper models first so it can stop early
+    MODEL_COSTS = {
+        'DeepID': 0.3,
+        'OpenFace': 0.5,
+        'SFace': 0.5,
+        'Facenet': 1.0,
+        'Facenet512': 1.0,
+        'ArcFace': 1.5,
+        'Dlib': 1.5,
+        'DeepFace': 3.0,
+        'VGG-Face': 5.0
+    }
+
+    # Ensemble early exit: stop once the running weighted confidence is above
+    # the high cutoff (backed by at least EARLY_EXIT_MIN_WEIGHT of model weight)
+    # or below the low cutoff
+    EARLY_EXIT_HIGH_CONFIDENCE = 0.92
+    EARLY_EXIT_LOW_CONFIDENCE = 0.05
+    EARLY_EXIT_MIN_WEIGHT = 2.0
+
+    # Producer/consumer pipeline sizing: prepared faces waiting for inference,
+    # and how many of them the inference stage embeds per predict call
+    PIPELINE_QUEUE_SIZE = 32
+    INFERENCE_BATCH_SIZE = 16
+
+    # Browser-like headers for profile photo downloads
+    DOWNLOAD_HEADERS = {
+        'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36',
+        'Accept': 'image/webp,image/apng,image/*,*/*;q=0.8',
+        'Accept-Language': 'en-US,en;q=0.9',
+    }
+
+    # Concurrent connections used to prefetch profile photos
+    DOWNLOAD_CONCURRENCY = 32
+
+    # Downloaded photos kept between searches; a search with more photos
+    # grows the image cache to hold all of them (see prefetch_images)
+    IMAGE_CACHE_SIZE = 512
+
+    # PIL ImageEnhance.Sharpness(1.3): 1.3 * image - 0.3 * ImageFilter.SMOOTH(image)
+    SHARPEN_KERNEL = (
+        1.3 * np.array([[0, 0, 0], [0, 1, 0], [0, 0, 0]], dtype=np.float32)
+        - 0.3 * np.array([[1, 1, 1], [1, 5, 1], [1, 1, 1]], dtype=np.float32) / 13
+    )
+
     def __init__(
         self,
         model_name: str = "VGG-Face",
@@ -87,7 +269,10 @@ class FaceRecognitionService:
         enhance_images: bool = True,
         face_quality_threshold: float = 0.0,
         use_parallel: bool = False,
-        max_workers: int = 4
+        max_workers: int = 4,
+        embedding_cache_path: Optional[str] = None,
+        preload_models: bool = True,
+        force_full_ensemble: bool = False
     ):
         self.model_name = model_name
         self.distance_metric = distance_metric
@@ -102,6 +287,7 @@ class FaceRecognitionService:
         self.face_quality_threshold = face_quality_threshold
         self.use_parallel = use_parallel
         self.max_workers = max_workers
+        self.force_full_ensemble = force_full_ensemble
 
         # Ensemble setup
         if ensemble_models:
@@ -112,100 +298,147 @@ class FaceRecognitionService:
         else:
             self.ensemble_models = [model_name]
 
-        self.image_cache = {}
-        self.face_cache = {}
-        self.embedding_cache = {}
+        # Cheapest models first, so early exit skips the expensive ones
+        self.ensemble_models = sorted(self.ensemble_models, key=lambda m: self.MODEL_COSTS.get(m, 1.0))
+
+        # Bounded so long-running services do not grow memory and the tempdir forever
+        self.image_cache = LruPathCache(self.IMAGE_CACHE_SIZE)
+        self.face_cache = LruCache(512)
+        self.embedding_cache = LruCache(4096)
+
+        # One keep-alive session for synchronous downloads, so repeat requests
+        # to the same CDN host skip the TCP/TLS handshake
+        self._http = requests.Session()
+        self._http.headers.update(self.DOWNLOAD_HEADERS)
+        adapter = HTTPAdapter(
+            pool_connections=self.DOWNLOAD_CONCURRENCY,
+            pool_maxsize=self.DOWNLOAD_CONCURRENCY,
+            max_retries=Retry(total=2, backoff_factor=0.2)
+        )
+        self._http.mount('https://', adapter)
+        self._http.mount('http://', adapter)
+
+        # URL hash -> hash of the downloaded image bytes, so URL variants of
+        # the same photo share one embedding
+        self.content_hash_map = {}
+
+        # Settings needed to rebuild the image preparation stage in worker processes
+        self._worker_config = {
+            'enforce_detection': enforce_detection,
+            'detector_backend': detector_backend,
+            'cache_images': cache_images,
+            'extract_faces': extract_faces,
+            'align_faces': align_faces,
+            'expand_face_region': expand_face_region,
+            'enhance_images': enhance_images,
+            'face_quality_threshold': face_quality_threshold,
+            'preload_models': False
+        }
 
-    def verify_image(self, image_path: str) -> bool:
-        """Quick verification that image exists and is valid."""
-        try:
-            if not Path(image_path).exists():
-                logger.debug(f"Image file not found: {image_path}")
-                return False
+        # Build every recognition model up front so the first comparison
+        # does not pay the model construction cost
+        self._models = {}
+        for model in (self.ensemble_models if preload_models else []):
+            try:
+                self._models[model] = build_recognition_model(model)
+            except Exception as e:
+                logger.warning(f"⚠️  Could not load model {model}: {str(e)[:100]}")
 
+        # Persistent embedding cache shared across runs, keyed by model and
+        # profile photo URL hash
+        self.embedding_store = None
+        if embedding_cache_path:
             try:
-                with Image.open(image_path) as img:
-                    if img.mode != 'RGB':
-                        rgb_path = Path(image_path).with_suffix('.jpg')
-                        img.convert('RGB').save(rgb_path, 'JPEG')
+                self.embedding_store = h5py.File(embedding_cache_path, 'a')
+                atexit.register(self.close_embedding_store)
             except Exception as e:
-                logger.debug(f"Failed to open image: {e}")
-                return False
+                logger.warning(f"⚠️  Could not open embedding cache {embedding_cache_path}: {e}")
 
-            return True
+    def close_embedding_store(self):
+        """Flush and close the persistent embedding cache (registered with atexit)."""
+        if self.embedding_store is None:
+            return
+
+        try:
+            self.embedding_store.close()
         except Exception as e:
-            logger.debug(f"Image verification failed: {e}")
-            return False
+            logger.warning(f"⚠️  Could not close embedding cache: {str(e)[:100]}")
+        self.embedding_store = None
 
-    def enhance_image_quality(self, image_path: str) -> str:
+    def verify_image(self, image_path: str) -> bool:
         """
-        Enhance image quality for better face recognition.
-        Applies brightness, contrast, and sharpness adjustments.
+        Quick check that an image file exists and is not empty.
+        Decoding problems surface when the image is loaded; downloads are
+        normalized once in store_downloaded_image.
         """
         try:
-            img = Image.open(image_path)
+            return Path(image_path).is_file() and os.path.getsize(image_path) > 0
+        except (OSError, TypeError, ValueError) as e:
+            logger.debug(f"Image verification failed: {e}")
+            return False
 
-            # Enhance contrast
-            enhancer = ImageEnhance.Contrast(img)
-            img = enhancer.enhance(1.2)
+    def load_image(self, image_path: str) -> Optional[np.ndarray]:
+        """Load an image as a BGR uint8 array, the layout DeepFace expects for arrays."""
+        try:
+            with open(image_path, 'rb') as f:
+                img = decode_image_bytes(f.read())
+        except OSError:
+            img = None
 
-            # Enhance sharpness
-            enhancer = ImageEnhance.Sharpness(img)
-            img = enhancer.enhance(1.3)
+        if img is None:
+            logger.debug(f"Failed to load image: {image_path}")
+        return img
 
-            # Enhance brightness slightly
-            enhancer = ImageEnhance.Brightness(img)
-            img = enhancer.enhance(1.1)
+    def enhance_image_quality(self, image_path: str) -> Optional[np.ndarray]:
+        """
+        Enhance image quality for better face recognition.
+        Applies contrast/brightness and sharpness adjustments in two fused
+        OpenCV passes equivalent to PIL's Contrast(1.2), Sharpness(1.3) and
+        Brightness(1.1) enhancers. Returns the enhanced image as a BGR array.
+        """
+        img = self.load_image(image_path)
+        if img is None:
+            return None
 
-            # Save enhanced image
-            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.jpg')
-            img.save(temp_file.name, 'JPEG', quality=95)
-            temp_file.close()
+        try:
+            # Contrast (1.2) around the grey mean, as PIL does, with brightness
+            # (1.1) folded in: 1.1 * (1.2 * x - 0.2 * mean) = 1.32 * x - 0.22 * mean.
+            # Sharpening is linear, so applying brightness first is equivalent
+            mean = int(cv2.cvtColor(img, cv2.COLOR_BGR2GRAY).mean() + 0.5)
+            img = cv2.addWeighted(img, 1.32, img, 0, -0.22 * mean)
+
+            # Sharpen
+            img = cv2.filter2D(img, -1, self.SHARPEN_KERNEL)
 
             logger.debug("Image enhanced")
-            return temp_file.name
+            return img
 
         except Exception as e:
             logger.debug(f"Image enhancement failed: {e}")
-            return image_path
+            return self.load_image(image_path)
 
-    def assess_face_quality(self, face_obj: Dict) -> float:
+    def assess_face_qualities(self, face_objs: List[Dict]) -> np.ndarray:
         """
-        Assess the quality of a detected face.
-        Returns quality score between 0 and 1.
+        Assess the quality of all detected faces in one vectorized pass.
+        Returns quality scores between 0 and 1, aligned with face_objs.
         """
-        try:
-            facial_area = face_obj.get('facial_area', {})
-            confidence = face_obj.get('confidence', 0.5)
-
-            # Check face size (larger is better)
-            face_width = facial_area.get('w', 0)
-            face_height = facial_area.get('h', 0)
-            face_area = face_width * face_height
-
-            # Normalize size score (assuming faces < 10000 pixels are small)
-            size_score = min(1.0, face_area / 10000.0)
-
-            # Detection confidence
-            conf_score = confidence
-
-            # Check aspect ratio (faces should be roughly square)
-            if face_width > 0 and face_height > 0:
-                aspect_ratio = face_width / face_height
-                # Ideal ratio is around 1.0, penalize extremes
-                aspect_score = 1.0 - abs(1.0 - aspect_ratio) * 0.5
-                aspect_score = max(0, min(1.0, aspect_score))
-            else:
-                aspect_score = 0.5
+        areas = [face_obj.get('facial_area', {}) for face_obj in face_objs]
+        widths = np.fromiter((area.get('w', 0) for area in areas), dtype=np.float32, count=len(areas))
+        heights = np.fromiter((area.get('h', 0) for area in areas), dtype=np.float32, count=len(areas))
+        confidences = np.fromiter(
+            (face_obj.get('confidence', 0.5) for face_obj in face_objs), dtype=np.float32, count=len(face_objs)
+        )
 
-            # Combined quality score
-            quality = (size_score * 0.4 + conf_score * 0.4 + aspect_score * 0.2)
+        # Normalize size score (assuming faces < 10000 pixels are small)
+        size_scores = np.minimum(1.0, widths * heights / 10000.0)
 
-            return quality
+        # Check aspect ratio (faces should be roughly square); ideal ratio is
+        # around 1.0, penalize extremes
+        aspect_scores = np.clip(1.0 - np.abs(1.0 - widths / np.maximum(heights, 1)) * 0.5, 0, 1.0)
+        aspect_scores = np.where((widths > 0) & (heights > 0), aspect_scores, 0.5)
 
-        except Exception as e:
-            logger.debug(f"Quality assessment failed: {e}")
-            return 0.5
+        # Combined quality score
+        return size_scores * 0.4 + confidences * 0.4 + aspect_scores * 0.2
 
     def download_and_cache_image(self, url: str) -> Optional[str]:
         """Download image from URL and cache it locally."""
@@ -216,7 +449,7 @@ class FaceRecognitionService:
             return url if self.verify_image(url) else None
 
         # Check cache first
-        url_hash = hashlib.md5(url.encode()).hexdigest()
+        url_hash = url_key(url)
 
         if self.cache_images and url_hash in self.image_cache:
             cached_path = self.image_cache[url_hash]
@@ -225,12 +458,7 @@ class FaceRecognitionService:
 
         try:
             logger.debug(f"Downloading: {url}")
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36',
-                'Accept': 'image/webp,image/apng,image/*,*/*;q=0.8',
-                'Accept-Language': 'en-US,en;q=0.9',
-            }
-            response = requests.get(url, headers=headers, timeout=15, stream=True, allow_redirects=True)
+            response = self._http.get(url, timeout=15, stream=True, allow_redirects=True)
             response.raise_for_status()
 
             temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.jpg')
@@ -239,54 +467,111 @@ class FaceRecognitionService:
                 temp_file.write(chunk)
 
             temp_file.close()
-            temp_path = temp_file.name
 
-            # Verify and convert to RGB
-            try:
-                image = Image.open(temp_path)
-                if image.mode != 'RGB':
-                    image = image.convert('RGB')
-                image.save(temp_path, 'JPEG')
-            except Exception as e:
-                logger.debug(f"Error processing downloaded image: {e}")
-                return None
+            return self.store_downloaded_image(url_hash, temp_file.name)
 
-            if self.verify_image(temp_path):
-                if self.cache_images:
-                    self.image_cache[url_hash] = temp_path
-                return temp_path
-            else:
-                return None
+        except Exception as e:
+            logger.debug(f"Failed to download image from {url}: {e}")
+            return None
+
+    def store_downloaded_image(self, url_hash: int, temp_path: str) -> Optional[str]:
+        """Convert a downloaded image to JPEG (if needed), verify it and add it to the image cache."""
+        try:
+            with open(temp_path, 'rb') as f:
+                data = f.read()
+
+            image = decode_image_bytes(data)
+            if image is None:
+                raise ValueError("undecodable image")
+
+            # Decoding always yields 3-channel BGR, so JPEGs are kept as downloaded
+            if data[:2] != b'\xff\xd8':
+                data = encode_jpeg(image)
+                with open(temp_path, 'wb') as f:
+                    f.write(data)
+        except Exception as e:
+            logger.debug(f"Error processing downloaded image: {e}")
+            return None
+
+        self.content_hash_map[url_hash] = hashlib.blake2b(data, digest_size=16).hexdigest()
+
+        if self.verify_image(temp_path):
+            if self.cache_images:
+                self.image_cache[url_hash] = temp_path
+            return temp_path
+        else:
+            return None
+
+    async def _fetch_image(self, session: aiohttp.ClientSession, url: str) -> Optional[str]:
+        """Stream one image to a tempfile and cache it."""
+        url_hash = url_key(url)
+
+        try:
+            async with session.get(url, allow_redirects=True) as response:
+                response.raise_for_status()
+
+                with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as temp_file:
+                    async for chunk in response.content.iter_chunked(8192):
+                        temp_file.write(chunk)
 
         except Exception as e:
             logger.debug(f"Failed to download image from {url}: {e}")
             return None
 
-    def extract_best_face(
-        self,
-        image_path: str,
-        target_size: tuple = (224, 224)
-    ) -> Optional[Tuple[str, float]]:
+        return self.store_downloaded_image(url_hash, temp_file.name)
+
+    async def _fetch_all(self, urls: List[str]):
+        """Download all images concurrently over a shared connection pool."""
+        connector = aiohttp.TCPConnector(limit=self.DOWNLOAD_CONCURRENCY)
+        timeout = aiohttp.ClientTimeout(total=15)
+
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout, headers=self.DOWNLOAD_HEADERS) as session:
+            await asyncio.gather(*(self._fetch_image(session, url) for url in urls))
+
+    def prefetch_images(self, urls: List[str]):
         """
-        Extract the best quality face from image.
-        Returns (path, quality_score) or None.
+        Populate the image cache for all remote URLs ahead of preprocessing,
+        so download latencies overlap instead of adding up.
         """
-        cache_key = hashlib.md5(f"{image_path}_extracted".encode()).hexdigest()
+        if not self.cache_images:
+            return
+
+        urls = list(dict.fromkeys(url for url in urls if url and url.startswith('http')))
+
+        # Make room for every photo of this search and mark the cached ones as
+        # recently used, so its downloads never evict (and delete) photos it
+        # has yet to preprocess
+        self.image_cache.maxsize = max(self.IMAGE_CACHE_SIZE, len(urls))
+        pending = []
+        for url in urls:
+            url_hash = url_key(url)
+            if url_hash in self.image_cache:
+                self.image_cache.move_to_end(url_hash)
+            else:
+                pending.append(url)
 
-        if self.cache_images and cache_key in self.face_cache:
-            cached_path, quality = self.face_cache[cache_key]
-            if self.verify_image(cached_path):
-                logger.debug(f"Using cached extracted face (quality: {quality:.2f})")
-                return cached_path, quality
+        if not pending:
+            return
 
+        logger.info(f"⬇️  Downloading {len(pending)} profile photos")
+
+        try:
+            asyncio.run(self._fetch_all(pending))
+        except Exception as e:
+            logger.warning(f"⚠️  Image prefetch failed: {str(e)[:100]}")
+
+    def extract_best_face(self, image: np.ndarray) -> Optional[Tuple[np.ndarray, float]]:
+        """
+        Extract the best quality face from a BGR image array.
+        Returns (face_array, quality_score) or None.
+        """
         try:
             # Extract faces using better detector
             face_objs = DeepFace.extract_faces(
-                img_path=image_path,
+                img_path=image,
                 detector_backend=self.detector_backend,
                 enforce_detection=False,
-                align=self.align_faces,
-                target_size=target_size
+                align=self.align_faces
             )
 
             if not face_objs:
@@ -294,14 +579,10 @@ class FaceRecognitionService:
                 return None
 
             # Select best quality face
-            best_face = None
-            best_quality = 0
-
-            for face_obj in face_objs:
-                quality = self.assess_face_quality(face_obj)
-                if quality > best_quality:
-                    best_quality = quality
-                    best_face = face_obj
+            qualities = self.assess_face_qualities(face_objs)
+            best_idx = int(qualities.argmax())
+            best_quality = float(qualities[best_idx])
+            best_face = face_objs[best_idx] if best_quality > 0 else None
 
             if best_face is None or best_quality < self.face_quality_threshold:
                 logger.debug(f"No face meets quality threshold ({best_quality:.2f} < {self.face_quality_threshold:.2f})")
@@ -309,49 +590,54 @@ class FaceRecognitionService:
 
             logger.debug(f"Selected face with quality: {best_quality:.2f}")
 
-            # Get the face image
+            # Get the face image (extract_faces returns RGB in [0, 1])
             face_img = best_face['face']
 
             if face_img.max() <= 1.0:
                 face_img = (face_img * 255).astype(np.uint8)
 
-            # Save to temporary file
-            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.jpg')
-            face_pil = Image.fromarray(face_img)
-            face_pil.save(temp_file.name, 'JPEG', quality=95)
-            temp_file.close()
-
-            # Cache the result
-            if self.cache_images:
-                self.face_cache[cache_key] = (temp_file.name, best_quality)
+            face_img = np.ascontiguousarray(face_img[:, :, ::-1])
 
-            return temp_file.name, best_quality
+            return face_img, best_quality
 
         except Exception as e:
             logger.debug(f"Face extraction failed: {str(e)[:100]}")
             return None
 
-    def preprocess_image(self, image_path: str) -> Tuple[str, float]:
+    def preprocess_image(self, image_path: str) -> Optional[Tuple[np.ndarray, float]]:
         """
         Preprocess image with enhancement and face extraction.
-        Returns (processed_path, quality_score).
+        Returns (face_array, quality_score), where face_array is a BGR image
+        ready to be embedded without another detection pass.
+        Extracted faces are cached by source path, and the cache is checked
+        before the image is decoded and enhanced.
         """
+        if self.extract_faces and self.cache_images and image_path in self.face_cache:
+            face, quality = self.face_cache[image_path]
+            logger.debug(f"Using cached extracted face (quality: {quality:.2f})")
+            return face, quality
+
         # Enhance image if enabled
         if self.enhance_images:
-            enhanced_path = self.enhance_image_quality(image_path)
+            image = self.enhance_image_quality(image_path)
         else:
-            enhanced_path = image_path
+            image = self.load_image(image_path)
+
+        if image is None:
+            return None
 
         # Extract face if enabled
         if self.extract_faces:
-            result = self.extract_best_face(enhanced_path)
+            result = self.extract_best_face(image)
             if result:
+                if self.cache_images:
+                    self.face_cache[image_path] = result
                 return result
             else:
                 logger.debug("Using original image (no face extracted)")
-                return enhanced_path, 0.5
+                return image, 0.5
         else:
-            return enhanced_path, 1.0
+            return image, 1.0
 
     def calculate_confidence(self, distance: float, model_name: str, quality1: float = 1.0, quality2: float = 1.0) -> float:
         """Calculate confidence score from distance and quality."""
@@ -369,33 +655,72 @@ class FaceRecognitionService:
 
         return max(0, min(1.0, adjusted_confidence))
 
+    def get_embedding(
+        self,
+        face: np.ndarray,
+        model_name: str,
+        cache_key: Optional[str] = None
+    ) -> Optional[np.ndarray]:
+        """
+        Compute the embedding of a preprocessed face array for a model.
+        Embeddings are cached per (model, cache_key) when a key is given.
+        """
+        if cache_key is not None and (model_name, cache_key) in self.embedding_cache:
+            return self.embedding_cache[(model_name, cache_key)]
+
+        try:
+            # The face was already detected and aligned during preprocessing
+            representations = DeepFace.represent(
+                img_path=face,
+                model_name=model_name,
+                detector_backend='skip',
+                align=False,
+                enforce_detection=False
+            )
+
+            if not representations:
+                return None
+
+            embedding = np.asarray(representations[0]['embedding'], dtype=np.float32)
+            if cache_key is not None:
+                self.embedding_cache[(model_name, cache_key)] = embedding
+            return embedding
+
+        except Exception as e:
+            logger.debug(f"Embedding failed with {model_name}: {str(e)[:100]}")
+            return None
+
     def compare_faces_single_model(
         self,
-        img1_path: str,
-        img2_path: str,
+        face1: np.ndarray,
+        face2: np.ndarray,
         model_name: str,
         quality1: float = 1.0,
         quality2: float = 1.0
     ) -> Optional[Dict[str, Any]]:
-        """Compare two faces using a single model."""
+        """Compare two faces using a single model (cosine distance on embeddings)."""
         try:
-            result = DeepFace.verify(
-                img1_path=img1_path,
-                img2_path=img2_path,
-                model_name=model_name,
-                distance_metric=self.distance_metric,
-                enforce_detection=self.enforce_detection,
-                detector_backend=self.detector_backend
-            )
+            emb1 = self.get_embedding(face1, model_name)
+            if emb1 is None:
+                return None
+
+            emb2 = self.get_embedding(face2, model_name)
+            if emb2 is None:
+                return None
+
+            norms = np.linalg.norm(emb1) * np.linalg.norm(emb2)
+            if norms == 0:
+                return None
 
-            distance = result['distance']
+            distance = 1.0 - float(emb1 @ emb2) / float(norms)
             confidence = self.calculate_confidence(distance, model_name, quality1, quality2)
+            threshold = self.THRESHOLDS.get(model_name, 0.40)
 
             return {
                 'distance': distance,
                 'confidence': confidence,
-                'verified': result.get('verified', False),
-                'threshold': result.get('threshold', self.THRESHOLDS.get(model_name, 0.40)),
+                'verified': distance <= threshold,
+                'threshold': threshold,
                 'model': model_name
             }
 
@@ -405,38 +730,53 @@ class FaceRecognitionService:
 
     def compare_faces_ensemble(
         self,
-        img1_path: str,
-        img2_path: str,
+        face1: np.ndarray,
+        face2: np.ndarray,
         quality1: float = 1.0,
         quality2: float = 1.0
     ) -> Optional[Dict[str, Any]]:
         """Compare faces using ensemble of models for better accuracy."""
         results = []
+        total_confidence = 0.0
+        total_weight = 0.0
 
         for model in self.ensemble_models:
-            result = self.compare_faces_single_model(img1_path, img2_path, model, quality1, quality2)
+            result = self.compare_faces_single_model(face1, face2, model, quality1, quality2)
             if result:
                 results.append(result)
 
+                weight = self.MODEL_WEIGHTS.get(model, 1.0)
+                total_confidence += result['confidence'] * weight
+                total_weight += weight
+
+                # Skip the remaining (more expensive) models once the vote is conclusive
+                if not self.force_full_ensemble and self.ensemble_decided(total_confidence, total_weight):
+                    break
+
+        return self.combine_model_results(results)
+
+    def ensemble_decided(self, total_confidence, total_weight):
+        """
+        Whether a running weighted ensemble confidence is already conclusive.
+        Works on scalars and on arrays of per-profile totals.
+        """
+        running_confidence = total_confidence / np.maximum(total_weight, 1e-12)
+        return (
+            ((running_confidence > self.EARLY_EXIT_HIGH_CONFIDENCE) & (total_weight >= self.EARLY_EXIT_MIN_WEIGHT))
+            | ((running_confidence < self.EARLY_EXIT_LOW_CONFIDENCE) & (total_weight > 0))
+        )
+
+    def combine_model_results(self, results: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Combine per-model comparison results by weighted voting."""
         if not results:
             return None
 
-        # Weighted voting based on model reliability
-        weights = {
-            'Facenet512': 1.5,
-            'ArcFace': 1.5,
-            'VGG-Face': 1.0,
-            'Facenet': 1.0,
-            'OpenFace': 0.8,
-            'DeepFace': 1.0
-        }
-
         total_confidence = 0
         total_weight = 0
         distances = []
 
         for result in results:
-            weight = weights.get(result['model'], 1.0)
+            weight = self.MODEL_WEIGHTS.get(result['model'], 1.0)
             total_confidence += result['confidence'] * weight
             total_weight += weight
             distances.append(result['distance'])
@@ -465,44 +805,131 @@ class FaceRecognitionService:
         """Compare two faces with preprocessing and optional ensemble."""
         try:
             # Preprocess both images
-            processed_img1, quality1 = self.preprocess_image(img1_path)
-            processed_img2, quality2 = self.preprocess_image(img2_path)
-
-            logger.debug(f"Image qualities: {quality1:.2f}, {quality2:.2f}")
-
-            # Use ensemble or single model
-            if self.use_ensemble:
-                result = self.compare_faces_ensemble(processed_img1, processed_img2, quality1, quality2)
-            else:
-                result = self.compare_faces_single_model(
-                    processed_img1, processed_img2, self.model_name, quality1, quality2
-                )
+            processed1 = self.preprocess_image(img1_path)
+            processed2 = self.preprocess_image(img2_path)
 
-            if result:
-                result['quality1'] = quality1
-                result['quality2'] = quality2
+            if not processed1 or not processed2:
+                return None
 
-            return result
+            return self.compare_preprocessed(processed1[0], processed1[1], processed2[0], processed2[1])
 
         except Exception as e:
             logger.debug(f"Face comparison failed: {str(e)[:100]}")
             return None
 
-    def process_single_profile(
+    def compare_preprocessed(
         self,
-        profile: Dict[str, Any],
-        target_image_path: str,
-        image_field: str,
-        index: int,
-        total: int
+        face1: np.ndarray,
+        quality1: float,
+        face2: np.ndarray,
+        quality2: float
     ) -> Optional[Dict[str, Any]]:
-        """Process a single profile comparison."""
-        # Handle nested linkedinData structure from web API
+        """Compare two already preprocessed faces with optional ensemble."""
+        logger.debug(f"Image qualities: {quality1:.2f}, {quality2:.2f}")
+
+        # Use ensemble or single model
+        if self.use_ensemble:
+            result = self.compare_faces_ensemble(face1, face2, quality1, quality2)
+        else:
+            result = self.compare_faces_single_model(
+                face1, face2, self.model_name, quality1, quality2
+            )
+
+        if result:
+            result['quality1'] = quality1
+            result['quality2'] = quality2
+
+        return result
+
+    def get_profile_photo_url(self, profile: Dict[str, Any]) -> Optional[str]:
+        """Get the profile photo URL from the nested linkedinData structure from web API."""
         linkedin_data = profile.get('linkedinData')
         if not linkedin_data:
             return None
 
-        profile_photo_url = linkedin_data.get('profile_photo')
+        return linkedin_data.get('profile_photo')
+
+    def load_cached_embeddings(
+        self,
+        url_hashes: List[int],
+        model_name: str,
+        rows: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Load the stored embeddings of a model for the given rows of url_hashes.
+        Returns (cached_rows, int8_embeddings) for the rows found in the cache;
+        rows whose entry cannot be read are left out, so they get recomputed.
+        """
+        cached_rows = []
+        embeddings = []
+
+        for row in rows.tolist():
+            key = f"{model_name}/{url_hashes[row]}"
+            try:
+                if key in self.embedding_store:
+                    embeddings.append(self.read_stored_embedding(self.embedding_store[key]))
+                    cached_rows.append(row)
+            except Exception as e:
+                logger.warning(f"  ⚠️  Could not read cached embedding {key}: {str(e)[:100]}")
+
+        if not cached_rows:
+            return np.array([], dtype=np.intp), np.empty((0, 0), dtype=np.int8)
+
+        return np.array(cached_rows, dtype=np.intp), np.stack(embeddings)
+
+    def read_stored_embedding(self, dataset: h5py.Dataset) -> np.ndarray:
+        """Read a stored embedding as int8; float entries are quantized on read."""
+        data = dataset[()]
+        if data.dtype == np.int8:
+            return data
+
+        return quantize_embeddings(data.astype(np.float32)[None])[0]
+
+    def store_embedding(
+        self,
+        model_name: str,
+        content_hash: str,
+        url_hash: int,
+        embedding: np.ndarray,
+        quality: float
+    ):
+        """
+        Store an int8-quantized profile photo embedding in the persistent cache
+        under its content hash, and link the URL hash to it for lookups before download.
+        """
+        key = f"{model_name}/{content_hash}"
+        if key in self.embedding_store:
+            del self.embedding_store[key]
+
+        dataset = self.embedding_store.create_dataset(
+            key, data=embedding, dtype='int8', compression='lzf'
+        )
+        dataset.attrs['quality'] = quality
+
+        self.link_url_embedding(model_name, content_hash, url_hash)
+
+    def link_url_embedding(self, model_name: str, content_hash: str, url_hash: int):
+        """Point the URL hash entry of a model at the embedding stored for its content hash."""
+        if url_hash == content_hash:
+            return
+
+        key = f"{model_name}/{url_hash}"
+        if key in self.embedding_store:
+            del self.embedding_store[key]
+
+        self.embedding_store[key] = h5py.SoftLink(f"/{model_name}/{content_hash}")
+
+    def prepare_profile(
+        self,
+        profile: Dict[str, Any],
+        index: int,
+        total: int
+    ) -> Optional[Tuple[np.ndarray, float]]:
+        """
+        Download and preprocess a single profile photo.
+        Returns (face_array, quality_score) or None.
+        """
+        profile_photo_url = self.get_profile_photo_url(profile)
         if not profile_photo_url:
             return None
 
@@ -517,30 +944,226 @@ class FaceRecognitionService:
             return None
 
         try:
-            result = self.compare_faces(target_image_path, profile_img_path)
+            return self.preprocess_image(profile_img_path)
+        except Exception as e:
+            logger.warning(f"  ⚠️  Error: {str(e)[:100]}")
+            return None
+
+    def share_detector_weights(self) -> Optional[Tuple[shared_memory.SharedMemory, List[Tuple]]]:
+        """
+        Copy the RetinaFace detector weights into shared memory so worker
+        processes can restore the detector without reading the weights file.
+        Returns (shared_memory, layout) or None.
+        """
+        if self.detector_backend != 'retinaface':
+            return None
+
+        try:
+            detector = DeepFace.build_model(model_name='retinaface', task='face_detector')
+            # retina-face wraps its Keras model in a tf.function
+            keras_model = getattr(detector.model, 'python_function', detector.model)
+            return share_weights(keras_model.get_weights())
+        except Exception as e:
+            logger.debug(f"Could not share detector weights: {str(e)[:100]}")
+            return None
 
-            if result:
-                match_data = {
-                    'profile': profile.copy(),
-                    'distance': result['distance'],
-                    'confidence': result['confidence'],
-                    'verified': result['verified'],
-                    'threshold': result['threshold'],
-                    'quality1': result.get('quality1', 1.0),
-                    'quality2': result.get('quality2', 1.0)
-                }
+    def load_profile_face(
+        self,
+        profile: Dict[str, Any],
+        index: int,
+        total: int
+    ) -> Optional[Tuple[int, np.ndarray, float, int, str]]:
+        """
+        Download, preprocess and extract the face of a profile photo.
+        Returns (index, face_array, quality_score, url_hash, content_hash) or None.
+        """
+        prepared = self.prepare_profile(profile, index, total)
+        if not prepared:
+            return None
+
+        face, quality = prepared
+        url_hash = url_key(self.get_profile_photo_url(profile))
+        content_hash = self.content_hash_map.get(url_hash, url_hash)
+        return index, face, quality, url_hash, content_hash
+
+    def embed_faces(self, faces: List[np.ndarray], model_name: str) -> np.ndarray:
+        """
+        Embed many faces with a single batched forward call. The model's own
+        forward is used, so non-Keras models (SFace, Dlib, Buffalo_L) and any
+        output post-processing (VGG-Face normalizes) behave as in DeepFace.represent.
+        Returns an (N, D) float32 array aligned with faces.
+        """
+        model = self._models.get(model_name) or build_recognition_model(model_name)
+        target_size = model.input_shape
 
-                logger.info(f"  ✓ Distance: {result['distance']:.4f}, Confidence: {result['confidence']:.2%}")
+        batch = np.concatenate([
+            preprocessing.normalize_input(
+                img=preprocessing.resize_image(img=face, target_size=(target_size[1], target_size[0])),
+                normalization='base'
+            )
+            for face in faces
+        ])
 
-                if self.use_ensemble:
-                    logger.info(f"  📊 Ensemble: {result.get('num_models', 0)} models")
+        embeddings = model.forward(batch)
 
-                return match_data
+        # Mixed precision models emit FP16; compare in FP32. A single face
+        # comes back as a flat vector
+        return np.asarray(embeddings, dtype=np.float32).reshape(len(faces), -1)
 
-        except Exception as e:
-            logger.warning(f"  ⚠️  Error: {str(e)[:100]}")
+    def embed_face_batch(
+        self,
+        batch: List[Tuple[int, np.ndarray, float, int, str]],
+        model_name: str,
+        rows: np.ndarray
+    ) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Embed the given rows of a batch of profile faces with one predict call.
+        Embeddings already in the persistent cache (under the same image content,
+        possibly from another URL) are reused; only misses are computed.
+        Returns (rows, int8_embeddings), or None if the model failed.
+        """
+        embeddings = [None] * len(rows)
+
+        if self.embedding_store is not None:
+            for j, row in enumerate(rows.tolist()):
+                _, _, _, url_hash, content_hash = batch[row]
+                key = f"{model_name}/{content_hash}"
+                try:
+                    if key in self.embedding_store:
+                        embeddings[j] = self.read_stored_embedding(self.embedding_store[key])
+                        self.link_url_embedding(model_name, content_hash, url_hash)
+                except Exception as e:
+                    # Unreadable entries are recomputed below
+                    logger.warning(f"  ⚠️  Could not read cached embedding {key}: {str(e)[:100]}")
+
+        misses = [j for j, embedding in enumerate(embeddings) if embedding is None]
+
+        if misses:
+            try:
+                computed = quantize_embeddings(
+                    self.embed_faces([batch[rows[j]][1] for j in misses], model_name)
+                )
+            except Exception as e:
+                logger.warning(f"  ⚠️  Embedding failed with {model_name}: {str(e)[:100]}")
+                return None
+
+            for j, embedding in zip(misses, computed):
+                embeddings[j] = embedding
+                if self.embedding_store is not None:
+                    _, _, quality, url_hash, content_hash = batch[rows[j]]
+                    try:
+                        self.store_embedding(model_name, content_hash, url_hash, embedding, quality)
+                    except Exception as e:
+                        logger.warning(f"  ⚠️  Could not cache embedding: {str(e)[:100]}")
+
+        return rows, np.stack(embeddings)
+
+    def score_profiles(
+        self,
+        qualities: List[float],
+        target_embeddings: Dict[str, np.ndarray],
+        target_quality: float,
+        embed: Callable[[str, np.ndarray], Optional[Tuple[np.ndarray, np.ndarray]]]
+    ) -> Tuple[List[Optional[Dict[str, Any]]], np.ndarray]:
+        """
+        Score profiles against the target one model at a time, in ensemble order.
+        target_embeddings holds the L2-normalized float32 target embedding per model.
+        embed(model, rows) returns (embedded_rows, int8_embeddings) for the requested
+        profile rows, or None if the model failed. int8 is only the storage format:
+        rows are upcast to float32 and normalized before scoring. In ensemble mode, profiles whose
+        running weighted confidence is already conclusive are dropped before the next
+        model runs. Returns one result per profile (None if no model scored it) and a
+        mask of the profiles that got every embedding they needed.
+        """
+        count = len(qualities)
+        model_results = [[] for _ in range(count)]
+        active = np.ones(count, dtype=bool)
+        complete = np.ones(count, dtype=bool)
+        total_confidence = np.zeros(count)
+        total_weight = np.zeros(count)
+
+        for model, target_embedding in target_embeddings.items():
+            rows = np.flatnonzero(active)
+            if not rows.size:
+                break
+
+            embedded = embed(model, rows)
+            if embedded is None:
+                continue
+
+            embedded_rows, profile_embeddings = embedded
+
+            # Profiles missing this model's embedding cannot finish the ensemble
+            missing = np.setdiff1d(rows, embedded_rows)
+            complete[missing] = False
+            active[missing] = False
+
+            if not embedded_rows.size:
+                continue
+
+            # Cosine similarity is scale invariant, so no quantization scale is
+            # needed; L2-normalize the float32 rows, then score all profiles
+            # against the (already normalized) target with a single BLAS sgemv
+            profile_embeddings = profile_embeddings.astype(np.float32)
+            profile_embeddings /= np.maximum(np.linalg.norm(profile_embeddings, axis=1, keepdims=True), 1e-12)
+
+            distances = 1.0 - profile_embeddings @ target_embedding
+            threshold = self.THRESHOLDS.get(model, 0.40)
+            weight = self.MODEL_WEIGHTS.get(model, 1.0)
+
+            for row, distance in zip(embedded_rows.tolist(), distances.tolist()):
+                confidence = self.calculate_confidence(distance, model, target_quality, qualities[row])
+                model_results[row].append({
+                    'distance': distance,
+                    'confidence': confidence,
+                    'verified': distance <= threshold,
+                    'threshold': threshold,
+                    'model': model
+                })
+                total_confidence[row] += confidence * weight
+                total_weight[row] += weight
+
+            if self.use_ensemble and not self.force_full_ensemble:
+                active &= ~self.ensemble_decided(total_confidence, total_weight)
+
+        if self.use_ensemble:
+            results = [self.combine_model_results(r) for r in model_results]
+        else:
+            results = [r[0] if r else None for r in model_results]
+
+        return results, complete
+
+    def assemble_matches(
+        self,
+        indices: List[int],
+        qualities: List[float],
+        results: List[Optional[Dict[str, Any]]],
+        profiles: List[Dict[str, Any]],
+        target_quality: float
+    ) -> List[Dict[str, Any]]:
+        """Build match entries for the scored profiles at the given indices."""
+        matches = []
+
+        for i, quality, result in zip(indices, qualities, results):
+            if not result:
+                continue
 
-        return None
+            matches.append({
+                'profile': profiles[i].copy(),
+                'distance': result['distance'],
+                'confidence': result['confidence'],
+                'verified': result['verified'],
+                'threshold': result['threshold'],
+                'quality1': target_quality,
+                'quality2': quality
+            })
+
+            logger.info(f"  ✓ {profiles[i].get('name', 'Unknown')} - Distance: {result['distance']:.4f}, Confidence: {result['confidence']:.2%}")
+
+            if self.use_ensemble:
+                logger.info(f"  📊 Ensemble: {result.get('num_models', 0)} models")
+
+        return matches
 
     def find_best_match(
         self,
@@ -565,30 +1188,163 @@ class FaceRecognitionService:
             logger.error("❌ No profiles provided")
             return None
 
+        # Preprocess and embed the target once per model
+        target = self.preprocess_image(target_image_path)
+
+        if not target:
+            logger.error("❌ Could not load target face")
+            return None
+
+        target_face, target_quality = target
+
+        models = self.ensemble_models if self.use_ensemble else [self.model_name]
+        target_embeddings = {}
+
+        for model in models:
+            try:
+                # Only the stored profile side is quantized; the target stays float32
+                target_embedding = self.embed_faces([target_face], model)[0].astype(np.float32)
+                target_embeddings[model] = target_embedding / max(float(np.linalg.norm(target_embedding)), 1e-12)
+            except Exception as e:
+                logger.warning(f"  ⚠️  Embedding failed with {model}: {str(e)[:100]}")
+
+        if not target_embeddings:
+            logger.error("❌ Could not compute target embedding")
+            return None
+
+        # Profiles whose photo embeddings are cached (for every model the
+        # ensemble needs) skip downloading and preprocessing entirely
         matches = []
+        pending = list(range(len(profiles)))
+
+        if self.embedding_store is not None:
+            first_model = next(iter(target_embeddings))
+            candidates = []
+            url_hashes = []
+            qualities = []
+            pending = []
 
-        # Parallel or sequential processing
-        if self.use_parallel:
-            logger.info(f"⚡ Using parallel processing with {self.max_workers} workers")
-            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-                futures = {
-                    executor.submit(
-                        self.process_single_profile,
-                        profile, target_image_path, image_field, i, len(profiles)
-                    ): i for i, profile in enumerate(profiles)
-                }
-
-                for future in as_completed(futures):
-                    result = future.result()
-                    if result:
-                        matches.append(result)
-        else:
             for i, profile in enumerate(profiles):
-                result = self.process_single_profile(
-                    profile, target_image_path, image_field, i, len(profiles)
+                url = self.get_profile_photo_url(profile)
+                url_hash = url_key(url) if url else None
+                key = f"{first_model}/{url_hash}"
+
+                try:
+                    if url_hash is not None and key in self.embedding_store:
+                        qualities.append(float(self.embedding_store[key].attrs.get('quality', 1.0)))
+                        candidates.append(i)
+                        url_hashes.append(url_hash)
+                        continue
+                except Exception as e:
+                    logger.warning(f"  ⚠️  Could not read cached embedding {key}: {str(e)[:100]}")
+
+                pending.append(i)
+
+            if candidates:
+                results, complete = self.score_profiles(
+                    qualities, target_embeddings, target_quality,
+                    lambda model, rows: self.load_cached_embeddings(url_hashes, model, rows)
                 )
-                if result:
-                    matches.append(result)
+                cached = [j for j in range(len(candidates)) if complete[j]]
+                pending = sorted(pending + [candidates[j] for j in range(len(candidates)) if not complete[j]])
+
+                logger.info(f"💾 Using cached embeddings for {len(cached)} profiles")
+                matches.extend(self.assemble_matches(
+                    [candidates[j] for j in cached],
+                    [qualities[j] for j in cached],
+                    [results[j] for j in cached],
+                    profiles, target_quality
+                ))
+
+        # Fetch all remaining photos concurrently before preprocessing
+        self.prefetch_images([self.get_profile_photo_url(profiles[i]) for i in pending])
+
+        # Stage A (CPU workers): enhance and extract profile faces, downloading any
+        # photo the prefetch missed.
+        # Stage B (this thread): drain the queue in batches and run inference,
+        # so image I/O overlaps with the forward passes instead of contending for them
+        # With use_parallel, Stage A runs in worker processes so face detection
+        # is not serialized on the GIL
+        face_queue = queue.Queue(maxsize=self.PIPELINE_QUEUE_SIZE)
+
+        if self.use_parallel and pending:
+            logger.info(f"⚡ Using parallel processing with {self.max_workers} worker processes")
+
+        def produce_faces():
+            shared_detector = None
+
+            try:
+                if self.use_parallel and pending:
+                    shared_detector = self.share_detector_weights()
+                    executor = ProcessPoolExecutor(
+                        max_workers=self.max_workers,
+                        mp_context=multiprocessing.get_context('spawn'),
+                        initializer=init_profile_worker,
+                        initargs=(
+                            self._worker_config, dict(self.image_cache), self.content_hash_map,
+                            (shared_detector[0].name, shared_detector[1]) if shared_detector else None
+                        )
+                    )
+                    load_profile_face = load_profile_face_in_worker
+                else:
+                    executor = ThreadPoolExecutor(max_workers=1)
+                    load_profile_face = self.load_profile_face
+
+                with executor:
+                    futures = [
+                        executor.submit(load_profile_face, profiles[i], i, len(profiles))
+                        for i in pending
+                    ]
+
+                    for future in as_completed(futures):
+                        try:
+                            item = future.result()
+                        except Exception as e:
+                            logger.warning(f"  ⚠️  Error: {str(e)[:100]}")
+                            continue
+                        if item:
+                            face_queue.put(item)
+            finally:
+                if shared_detector:
+                    shared_detector[0].close()
+                    shared_detector[0].unlink()
+                face_queue.put(None)
+
+        producer = threading.Thread(target=produce_faces, daemon=True)
+        producer.start()
+
+        finished = False
+
+        while not finished:
+            item = face_queue.get()
+            if item is None:
+                break
+
+            batch = [item]
+            while len(batch) < self.INFERENCE_BATCH_SIZE:
+                item = face_queue.get()
+                if item is None:
+                    finished = True
+                    break
+                batch.append(item)
+
+            qualities = [quality for _, _, quality, _, _ in batch]
+            results, _ = self.score_profiles(
+                qualities, target_embeddings, target_quality,
+                lambda model, rows: self.embed_face_batch(batch, model, rows)
+            )
+
+            if self.embedding_store is not None:
+                try:
+                    self.embedding_store.flush()
+                except Exception as e:
+                    logger.warning(f"  ⚠️  Could not flush embedding cache: {str(e)[:100]}")
+
+            matches.extend(self.assemble_matches(
+                [i for i, _, _, _, _ in batch], qualities, results, profiles, target_quality
+            ))
+
+        producer.join()
 
         logger.info(f"\n{'='*60}")
         logger.info(f"Processed: {len(matches)}/{len(profiles)} profiles")
@@ -597,9 +1353,6 @@ class FaceRecognitionService:
             logger.warning("❌ No valid comparisons completed")
             return None
 
-        # Sort by confidence
-        matches.sort(key=lambda x: x['confidence'], reverse=True)
-
         # Filter by minimum confidence
         if min_confidence > 0:
             matches = [m for m in matches if m['confidence'] >= min_confidence]
@@ -609,12 +1362,15 @@ class FaceRecognitionService:
             logger.warning(f"❌ No matches above {min_confidence:.0%} confidence threshold")
             return None
 
+        # Select the top matches by confidence (N log K instead of a full sort)
+        top_matches = heapq.nlargest(return_top_n, matches, key=operator.itemgetter('confidence'))
+
         # Show top matches
         logger.info(f"\n{'='*60}")
-        logger.info(f"TOP {min(return_top_n, len(matches))} MATCH(ES)")
+        logger.info(f"TOP {len(top_matches)} MATCH(ES)")
         logger.info(f"{'='*60}")
 
-        for idx, match in enumerate(matches[:return_top_n], 1):
+        for idx, match in enumerate(top_matches, 1):
             profile = match['profile']
             linkedin_data = profile.get('linkedinData', {})
             logger.info(f"\n#{idx} - {profile.get('name', 'Unknown')}")
@@ -624,7 +1380,7 @@ class FaceRecognitionService:
             logger.info(f"    Quality: {match['quality1']:.2f} / {match['quality2']:.2f}")
 
         if return_top_n == 1:
-            best = matches[0]
+            best = top_matches[0]
             return {
                 "matched_profile": best['profile'],
                 "confidence": best['confidence'],
@@ -640,12 +1396,96 @@ class FaceRecognitionService:
                         "face_distance": m['distance'],
                         "verified": m['verified']
                     }
-                    for m in matches[:return_top_n]
+                    for m in top_matches
                 ],
                 "total_found": len(matches)
             }
 
 
+# Image preparation service of the current worker process (see init_profile_worker)
+worker_service = None
+
+
+def share_weights(weights: List[np.ndarray]) -> Tuple[shared_memory.SharedMemory, List[Tuple]]:
+    """
+    Pack model weights into one shared memory block.
+    Returns (shared_memory, layout) where layout holds (shape, dtype, offset) per weight.
+    """
+    layout = []
+    offset = 0
+    for weight in weights:
+        layout.append((weight.shape, weight.dtype.str, offset))
+        offset += weight.nbytes
+
+    shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    for weight, (shape, dtype, offset) in zip(weights, layout):
+        np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)[...] = weight
+
+    return shm, layout
+
+
+def restore_shared_retinaface(shm_name: str, layout: List[Tuple]):
+    """
+    Rebuild the RetinaFace detector from weights in shared memory and install
+    it as retina-face's model singleton, so DeepFace picks it up.
+    """
+    from retinaface import RetinaFace
+    from retinaface.model import retinaface_model
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        weights = [
+            np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset).copy()
+            for shape, dtype, offset in layout
+        ]
+    finally:
+        shm.close()
+
+    # Build the architecture only; the weights come from the parent process
+    load_weights = retinaface_model.load_weights
+    retinaface_model.load_weights = lambda model: model
+    try:
+        model = retinaface_model.build_model()
+    finally:
+        retinaface_model.load_weights = load_weights
+
+    model.set_weights(weights)
+    RetinaFace.model = tf.function(
+        model,
+        input_signature=(tf.TensorSpec(shape=[None, None, None, 3], dtype=np.float32),)
+    )
+
+
+def init_profile_worker(
+    config: Dict[str, Any],
+    image_cache: Dict[int, str],
+    content_hash_map: Dict[int, str],
+    shared_detector: Optional[Tuple[str, List[Tuple]]] = None
+):
+    """Create the image preparation service in a worker process."""
+    global worker_service
+
+    # Workers must never write to the JSON stdout channel
+    sys.stdout = sys.stderr
+
+    if shared_detector:
+        try:
+            restore_shared_retinaface(*shared_detector)
+        except Exception as e:
+            logger.debug(f"Could not restore shared detector: {str(e)[:100]}")
+
+    worker_service = FaceRecognitionService(**config)
+    # The cached files belong to the parent, so workers use a plain dict
+    # that never evicts (and deletes) them
+    worker_service.image_cache = dict(image_cache)
+    worker_service.content_hash_map.update(content_hash_map)
+
+
+def load_profile_face_in_worker(profile: Dict[str, Any], index: int, total: int):
+    """Run FaceRecognitionService.load_profile_face in a worker process."""
+    return worker_service.load_profile_face(profile, index, total)
+
+
 def decode_base64_image(base64_string: str, output_path: str) -> bool:
     """
     Decode base64 image string and save to file
@@ -658,20 +1498,18 @@ def decode_base64_image(base64_string: str, output_path: str) -> bool:
         True if successful, False otherwise
     """
     try:
-        # Remove data URI prefix if present
-        if ',' in base64_string:
-            base64_string = base64_string.split(',')[1]
-
-        # Decode base64 to bytes
-        image_data = base64.b64decode(base64_string)
-
-        # Open and convert image to RGB (DeepFace requirement)
-        image = Image.open(io.BytesIO(image_data))
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-
-        # Save as JPEG
-        image.save(output_path, 'JPEG')
+        # Skip the data URI prefix if present and decode base64 to bytes
+        payload_start = base64_string.find(',') + 1
+        image_data = base64.b64decode(base64_string[payload_start:] if payload_start else base64_string)
+
+        # Decode straight from the bytes (always 3-channel) to validate the image
+        image = decode_image_bytes(image_data)
+        if image is None:
+            raise ValueError("undecodable image")
+
+        # JPEGs are written as received; anything else is re-encoded as JPEG
+        with open(output_path, 'wb') as f:
+            f.write(image_data if image_data[:2] == b'\xff\xd8' else encode_jpeg(image))
         return True
 
     except Exception as e:
@@ -679,6 +1517,13 @@ def decode_base64_image(base64_string: str, output_path: str) -> bool:
         return False
 
 
+def write_json(fd: int, payload: Dict[str, Any]):
+    """Write a JSON payload as one line to a raw file descriptor."""
+    data = (json.dumps(payload) + '\n').encode()
+    while data:
+        data = data[os.write(fd, data):]
+
+
 def main():
     """
     Main function to run face matching from command line
@@ -689,14 +1534,17 @@ def main():
     Output:
         JSON object with match results to stdout
     """
-    # Install stdout filter to prevent library outputs from contaminating JSON
-    sys.stdout = StdoutFilter()
+    # Keep the real stdout for the JSON result and point fd 1 at stderr, so
+    # nothing libraries print (from Python or native code) can contaminate it
+    sys.stdout.flush()
+    json_fd = os.dup(1)
+    os.dup2(2, 1)
 
     if len(sys.argv) != 3:
-        print(json.dumps({
+        write_json(json_fd, {
             'success': False,
             'error': 'Usage: python faceRecognitionService.py <base64_image> <attendees_json_path>'
-        }))
+        })
         sys.exit(1)
 
     base64_image = sys.argv[1]
@@ -710,10 +1558,10 @@ def main():
     target_image_path = temp_dir / 'target_face.jpg'
 
     if not decode_base64_image(base64_image, str(target_image_path)):
-        print(json.dumps({
+        write_json(json_fd, {
             'success': False,
             'error': 'Failed to decode base64 image'
-        }))
+        })
         sys.exit(1)
 
     # Load attendees data
@@ -722,10 +1570,10 @@ def main():
             attendees_data = json.load(f)
             attendees = attendees_data.get('attendees', [])
     except Exception as e:
-        print(json.dumps({
+        write_json(json_fd, {
             'success': False,
             'error': f'Failed to load attendees JSON: {str(e)}'
-        }))
+        })
         sys.exit(1)
 
     # Initialize advanced service with optimal configuration
@@ -742,8 +1590,9 @@ def main():
         ensemble_models=['Facenet512', 'ArcFace', 'VGG-Face'],
         enhance_images=True,
         face_quality_threshold=0.3,
-        use_parallel=True,  # Parallel processing for speed
-        max_workers=4
+        use_parallel=True,  # Parallel image download/preprocessing for speed
+        max_workers=8,
+        embedding_cache_path=str(temp_dir / 'emb_cache.h5')  # Reuse embeddings across runs
     )
 
     # Find best match
@@ -763,7 +1612,7 @@ def main():
 
     # Output result as JSON to stdout (stderr used for logging)
     if match_result:
-        print(json.dumps({
+        write_json(json_fd, {
             'success': True,
             'match': {
                 'profile': match_result['matched_profile'],
@@ -771,12 +1620,12 @@ def main():
                 'distance': match_result['face_distance'],
                 'verified': match_result['verified']
             }
-        }))
+        })
     else:
-        print(json.dumps({
+        write_json(json_fd, {
             'success': False,
             'error': 'No matching face found'
-        }))
+        })
 
 
 if __name__ == '__main__':
@@ -1,4 +1,6 @@
 import OpenAI from 'openai';
+import crypto from 'crypto';
+import { readScoringCache, writeScoringCache } from './scoringCache';
 
 // Initialize OpenAI client
 const apiKey = process.env.OPENAI_API_KEY;
@@ -8,6 +10,47 @@ if (!apiKey) {
 
 const client = apiKey ? new OpenAI({ apiKey }) : null;
 
+// Using faster model - change to 'gpt-4o' for better quality
+const SCORING_MODEL = 'gpt-4o-mini';
+
+// OpenAI requests-per-minute limit for the scoring model
+const SCORING_REQUESTS_PER_MINUTE = 500;
+
+/**
+ * Token bucket rate limiter
+ * Allows bursts up to `capacity` requests and refills at capacity / periodMs,
+ * so callers only wait once the rate limit would actually be exceeded
+ */
+class RateLimiter {
+  private tokens: number;
+  private lastRefill = Date.now();
+
+  constructor(private readonly capacity: number, private readonly periodMs: number) {
+    this.tokens = capacity;
+  }
+
+  async acquire(): Promise<void> {
+    for (;;) {
+      const now = Date.now();
+      this.tokens = Math.min(
+        this.capacity,
+        this.tokens + ((now - this.lastRefill) * this.capacity) / this.periodMs
+      );
+      this.lastRefill = now;
+
+      if (this.tokens >= 1) {
+        this.tokens -= 1;
+        return;
+      }
+
+      const waitMs = ((1 - this.tokens) * this.periodMs) / this.capacity;
+      await new Promise(resolve => setTimeout(resolve, waitMs));
+    }
+  }
+}
+
+const scoringLimiter = new RateLimiter(SCORING_REQUESTS_PER_MINUTE, 60_000);
+
 // TypeScript interface matching Python's HackathonEvaluation Pydantic model
 export interface HackathonEvaluation {
   hackathons_won: number | string; // number or "unavailable"
@@ -17,6 +60,79 @@ export interface HackathonEvaluation {
   summary: string;
 }
 
+// Constant scoring instructions, sent as the system message so every request
+// shares an identical prefix (eligible for OpenAI prompt caching) and only the
+// profile text varies
+const SCORING_INSTRUCTIONS = `Analyze the LinkedIn profile given by the user to evaluate hackathon partnership potential.
+
+Extract and score:
+
+1. Hackathons won: count if mentioned, otherwise use "unavailable"
+
+2. Overall Score (1-100 scale with percentile calibration):
+   - Holistic hackathon readiness combining technical skill + collaboration + execution track record
+   - Consider: Technical projects, languages, frameworks, system design, teamwork, leadership, communication
+   - CALIBRATION: Population of university students where median = 50, top 10% = 80+, exceptional = 90+
+   - Distribute scores across 40-70 range for most candidates
+   - Only truly exceptional profiles score 85+. Avoid clustering around 70-80
+
+3. Summaries:
+   - technical_skill_summary: Paragraph about technical abilities and projects
+   - collaboration_summary: Paragraph about teamwork and collaboration abilities
+   - summary: Overall paragraph summarizing interests and background`;
+
+// Structured-output schema for HackathonEvaluation, built once at module load
+// instead of being re-created for every scoring request
+const HACKATHON_RESPONSE_FORMAT = {
+  type: 'json_schema' as const,
+  json_schema: {
+    name: 'HackathonEvaluation',
+    strict: true,
+    schema: {
+      type: 'object',
+      properties: {
+        hackathons_won: {
+          type: ['number', 'string'],
+          description: "Number of hackathons won, or 'unavailable' if not mentioned"
+        },
+        overall_score: {
+          type: 'number',
+          minimum: 1,
+          maximum: 100,
+          description: 'Overall hackathon readiness score 1-100'
+        },
+        technical_skill_summary: {
+          type: 'string',
+          description: 'Paragraph summary of technical skills'
+        },
+        collaboration_summary: {
+          type: 'string',
+          description: 'Paragraph summary of collaboration ability'
+        },
+        summary: {
+          type: 'string',
+          description: 'Overall paragraph summary'
+        }
+      },
+      required: [
+        'hackathons_won',
+        'overall_score',
+        'technical_skill_summary',
+        'collaboration_summary',
+        'summary'
+      ],
+      additionalProperties: false
+    }
+  }
+};
+
+// Version of the prompt and schema above, part of the scoring cache key so
+// evaluations made with an older prompt are not served after it changes
+const SCORING_PROMPT_VERSION = crypto
+  .createHash('sha1')
+  .update(`${SCORING_INSTRUCTIONS}\n${JSON.stringify(HACKATHON_RESPONSE_FORMAT)}`)
+  .digest('hex');
+
 // LinkedIn profile structure (imported from linkedinScraper.ts)
 interface LinkedInProfile {
   profile_photo?: string;
@@ -171,73 +287,25 @@ export async function scoreCandidate(profileData: LinkedInProfile): Promise<Scor
       };
     }
 
-    const prompt = `Analyze this LinkedIn profile to evaluate hackathon partnership potential.
-
-Profile:
-"""${profileText}"""
-
-Extract and score:
-
-1. Hackathons won: count if mentioned, otherwise use "unavailable"
-
-2. Overall Score (1-100 scale with percentile calibration):
-   - Holistic hackathon readiness combining technical skill + collaboration + execution track record
-   - Consider: Technical projects, languages, frameworks, system design, teamwork, leadership, communication
-   - CALIBRATION: Population of university students where median = 50, top 10% = 80+, exceptional = 90+
-   - Distribute scores across 40-70 range for most candidates
-   - Only truly exceptional profiles score 85+. Avoid clustering around 70-80
+    // Identical profile text was already scored by this model and prompt
+    const cachedEvaluation = readScoringCache(SCORING_MODEL, SCORING_PROMPT_VERSION, profileText);
+    if (cachedEvaluation) {
+      return {
+        success: true,
+        evaluation: cachedEvaluation
+      };
+    }
 
-3. Summaries:
-   - technical_skill_summary: Paragraph about technical abilities and projects
-   - collaboration_summary: Paragraph about teamwork and collaboration abilities
-   - summary: Overall paragraph summarizing interests and background`;
+    await scoringLimiter.acquire();
 
     const response = await client.chat.completions.create({
-      model: 'gpt-4o-mini', // Using faster model - change to 'gpt-4o' for better quality
-      messages: [{ role: 'user', content: prompt }],
+      model: SCORING_MODEL,
+      messages: [
+        { role: 'system', content: SCORING_INSTRUCTIONS },
+        { role: 'user', content: `Profile:\n"""${profileText}"""` }
+      ],
       temperature: 0.3, // Lower temperature for more consistent scoring
-      response_format: {
-        type: 'json_schema',
-        json_schema: {
-          name: 'HackathonEvaluation',
-          strict: true,
-          schema: {
-            type: 'object',
-            properties: {
-              hackathons_won: {
-                type: ['number', 'string'],
-                description: "Number of hackathons won, or 'unavailable' if not mentioned"
-              },
-              overall_score: {
-                type: 'number',
-                minimum: 1,
-                maximum: 100,
-                description: 'Overall hackathon readiness score 1-100'
-              },
-              technical_skill_summary: {
-                type: 'string',
-                description: 'Paragraph summary of technical skills'
-              },
-              collaboration_summary: {
-                type: 'string',
-                description: 'Paragraph summary of collaboration ability'
-              },
-              summary: {
-                type: 'string',
-                description: 'Overall paragraph summary'
-              }
-            },
-            required: [
-              'hackathons_won',
-              'overall_score',
-              'technical_skill_summary',
-              'collaboration_summary',
-              'summary'
-            ],
-            additionalProperties: false
-          }
-        }
-      }
+      response_format: HACKATHON_RESPONSE_FORMAT
     });
 
     const content = response.choices[0]?.message?.content;
@@ -249,6 +317,7 @@ Extract and score:
     }
 
     const evaluation: HackathonEvaluation = JSON.parse(content);
+    writeScoringCache(SCORING_MODEL, SCORING_PROMPT_VERSION, profileText, evaluation);
 
     return {
       success: true,
@@ -265,7 +334,8 @@ Extract and score:
 
 /**
  * Scores multiple candidates in parallel with controlled concurrency
- * Uses semaphore-like pattern with Promise.all for efficient batching
+ * Runs a pool of maxConcurrent workers that each pull the next profile as soon
+ * as their previous request finishes, so one slow response never stalls a batch
  */
 export async function scoreMultipleCandidatesParallel(
   profiles: Array<{ id: string; data: LinkedInProfile }>,
@@ -273,23 +343,22 @@ export async function scoreMultipleCandidatesParallel(
   onProgress?: (id: string, result: ScoringResult) => void
 ): Promise<Map<string, ScoringResult>> {
   const results = new Map<string, ScoringResult>();
+  let nextIndex = 0;
 
-  // Process in batches of maxConcurrent
-  for (let i = 0; i < profiles.length; i += maxConcurrent) {
-    const batch = profiles.slice(i, i + maxConcurrent);
+  const worker = async () => {
+    while (nextIndex < profiles.length) {
+      const profile = profiles[nextIndex++];
+      const result = await scoreCandidate(profile.data);
+      results.set(profile.id, result);
 
-    // Process all profiles in this batch concurrently
-    await Promise.all(
-      batch.map(async (profile) => {
-        const result = await scoreCandidate(profile.data);
-        results.set(profile.id, result);
+      if (onProgress) {
+        onProgress(profile.id, result);
+      }
+    }
+  };
 
-        if (onProgress) {
-          onProgress(profile.id, result);
-        }
-      })
-    );
-  }
+  const workerCount = Math.max(1, Math.min(maxConcurrent, profiles.length));
+  await Promise.all(Array.from({ length: workerCount }, worker));
 
   return results;
 }
@@ -310,11 +379,6 @@ export async function scoreMultipleCandidates(
     if (onProgress) {
       onProgress(profile.id, result);
     }
-
-    // Rate limiting: 1 second delay between API calls
-    if (profiles.indexOf(profile) < profiles.length - 1) {
-      await new Promise(resolve => setTimeout(resolve, 1000));
-    }
   }
 
   return results;
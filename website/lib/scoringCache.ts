@@ -0,0 +1,101 @@
+import fs from 'fs';
+import path from 'path';
+import crypto from 'crypto';
+import { isCacheValid } from './linkedinCache';
+
+/**
+ * OpenAI Scoring Cache System
+ *
+ * Caches candidate evaluations keyed by a hash of the model, prompt version and
+ * profile text, so re-scoring an unchanged profile costs neither latency nor API
+ * credits, and changing the prompt or response schema invalidates old entries.
+ * Cache files are stored in temp/scoring_cache/ directory.
+ */
+
+const CACHE_DIR = path.join(process.cwd(), 'temp', 'scoring_cache');
+const MAX_AGE_DAYS = 7;
+
+// Evaluations already read or written by this process
+const memoryCache = new Map<string, CachedEvaluation>();
+
+interface CachedEvaluation {
+  model: string;
+  cachedAt: string;
+  evaluation: any; // HackathonEvaluation type
+}
+
+/**
+ * Build cache key for a scoring request
+ *
+ * @param model - OpenAI model name
+ * @param promptVersion - Hash of the scoring instructions and response schema
+ * @param profileText - Formatted profile text sent in the prompt
+ * @returns SHA-1 hex digest of model, prompt version and profile text
+ */
+export function getScoringCacheKey(model: string, promptVersion: string, profileText: string): string {
+  return crypto.createHash('sha1').update(`${model}\n${promptVersion}\n${profileText}`).digest('hex');
+}
+
+/**
+ * Read a cached evaluation
+ *
+ * @param model - OpenAI model name
+ * @param promptVersion - Hash of the scoring instructions and response schema
+ * @param profileText - Formatted profile text sent in the prompt
+ * @returns Cached evaluation or null if missing, expired or invalid
+ */
+export function readScoringCache(model: string, promptVersion: string, profileText: string): any | null {
+  const key = getScoringCacheKey(model, promptVersion, profileText);
+
+  let cached = memoryCache.get(key);
+
+  if (!cached) {
+    const filePath = path.join(CACHE_DIR, `${key}.json`);
+    if (!fs.existsSync(filePath)) {
+      return null;
+    }
+
+    try {
+      cached = JSON.parse(fs.readFileSync(filePath, 'utf-8')) as CachedEvaluation;
+    } catch (error) {
+      console.error(`❌ Failed to read scoring cache ${key}:`, error);
+      return null;
+    }
+  }
+
+  if (!isCacheValid(cached.cachedAt, MAX_AGE_DAYS)) {
+    memoryCache.delete(key);
+    return null;
+  }
+
+  memoryCache.set(key, cached);
+  return cached.evaluation;
+}
+
+/**
+ * Write an evaluation to the cache
+ *
+ * @param model - OpenAI model name
+ * @param promptVersion - Hash of the scoring instructions and response schema
+ * @param profileText - Formatted profile text sent in the prompt
+ * @param evaluation - Parsed evaluation returned by OpenAI
+ */
+export function writeScoringCache(model: string, promptVersion: string, profileText: string, evaluation: any): void {
+  const key = getScoringCacheKey(model, promptVersion, profileText);
+  const cacheData: CachedEvaluation = {
+    model,
+    cachedAt: new Date().toISOString(),
+    evaluation,
+  };
+
+  memoryCache.set(key, cacheData);
+
+  try {
+    if (!fs.existsSync(CACHE_DIR)) {
+      fs.mkdirSync(CACHE_DIR, { recursive: true });
+    }
+    fs.writeFileSync(path.join(CACHE_DIR, `${key}.json`), JSON.stringify(cacheData, null, 2), 'utf-8');
+  } catch (error) {
+    console.error(`❌ Failed to write scoring cache ${key}:`, error);
+  }
+}